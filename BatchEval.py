@@ -0,0 +1,83 @@
+"""
+Evaluates many positions at once with NumPy
+A position is 64 int8 piece codes, row * 8 + col like the board list: 0 for an empty square,
+1 to 6 for a white pawn, knight, bishop, rook, queen, king and -1 to -6 for the black ones,
+or the same as 12 one-hot planes of 64, white pawn first and black king last
+Scores come from the piece-square tables in Evaluation,
+so each one is exactly what ScoreBoard gives the position
+NumPy is only needed by this module, the game and the search run without it
+"""
+
+import itertools
+
+import numpy as np
+
+import Evaluation
+import SmartMoveFinder
+
+PIECE_TYPES = ("P", "N", "B", "R", "Q", "K")
+CODES = {"--": 0}
+for code, pieceType in enumerate(PIECE_TYPES, 1):
+    CODES["w" + pieceType] = code
+    CODES["b" + pieceType] = -code
+PLANE_CODES = np.array(list(range(1, 7)) + list(range(-1, -7, -1)), dtype=np.int8)  # piece code of each plane
+
+SQUARES = np.arange(64)
+# material plus position in tenths of a pawn for code + 6 on each square, + is good for white
+SCORE_TABLE = np.zeros((13, 64), dtype=np.int64)
+MATERIAL_TABLE = np.zeros(13, dtype=np.int64)
+for piece, code in CODES.items():
+    if code != 0:
+        SCORE_TABLE[code + 6] = Evaluation.pieceSquareScores[piece]
+        MATERIAL_TABLE[code + 6] = Evaluation.pieceScore[piece[1]] * (1 if code > 0 else -1)
+PLANE_SCORE_TABLE = SCORE_TABLE[PLANE_CODES.astype(np.intp) + 6]  # (12, 64), the rows in plane order
+
+
+# (N, 64) int8 piece codes of the game states' boards
+def EncodeBoards(gameStates):
+    gameStates = list(gameStates)
+    squares = itertools.chain.from_iterable(itertools.chain.from_iterable(gs.board for gs in gameStates))
+    return np.fromiter(map(CODES.__getitem__, squares), dtype=np.int8,
+                       count=64 * len(gameStates)).reshape(len(gameStates), 64)
+
+
+# (N, 64) piece codes as (N, 12, 64) one-hot planes
+def ToPlanes(codes):
+    return (np.asarray(codes)[:, None, :] == PLANE_CODES[None, :, None]).astype(np.int8)
+
+
+# (N, 64) piece codes of (N, 12, 64) one-hot planes
+def FromPlanes(planes):
+    return np.tensordot(np.asarray(planes), PLANE_CODES, axes=([1], [0])).astype(np.int8)
+
+
+# (N,) scores of (N, 64) piece codes or (N, 12, 64) planes, in pawns with + good for white
+# the same as ScoreBoard for each position, apart from checkmate and stalemate, which the board alone can't show
+def ScoreBoards(positions):
+    positions = np.asarray(positions)
+    if positions.ndim == 2 and positions.shape[1] == 64:
+        totals = SCORE_TABLE[positions.astype(np.intp) + 6, SQUARES].sum(axis=1)
+    elif positions.ndim == 3 and positions.shape[1:] == (12, 64):
+        totals = np.tensordot(positions.astype(np.int64), PLANE_SCORE_TABLE, axes=([1, 2], [0, 1]))
+    else:
+        raise ValueError(f"positions must be (N, 64) piece codes or (N, 12, 64) planes, not {positions.shape}")
+    return totals / 10
+
+
+# (N,) material of (N, 64) piece codes or (N, 12, 64) planes, the same as ScoreMaterial
+def ScoreMaterials(positions):
+    positions = np.asarray(positions)
+    if positions.ndim == 3:
+        positions = FromPlanes(positions)
+    return MATERIAL_TABLE[positions.astype(np.intp) + 6].sum(axis=1)
+
+
+# (N,) ScoreBoard of each game state, checkmate and stalemate included
+def ScoreGameStates(gameStates):
+    gameStates = list(gameStates)
+    scores = ScoreBoards(EncodeBoards(gameStates))
+    checkmate = np.fromiter((gs.checkmate for gs in gameStates), dtype=bool, count=len(gameStates))
+    stalemate = np.fromiter((gs.stalemate for gs in gameStates), dtype=bool, count=len(gameStates))
+    whiteToMove = np.fromiter((gs.whiteToMove for gs in gameStates), dtype=bool, count=len(gameStates))
+    scores = np.where(stalemate, SmartMoveFinder.STALEMATE, scores)
+    return np.where(checkmate, np.where(whiteToMove, -SmartMoveFinder.CHECKMATE, SmartMoveFinder.CHECKMATE), scores)
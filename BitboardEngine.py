@@ -0,0 +1,386 @@
+"""
+Bitboard backend for the game state
+Keeps one 64-bit integer per piece type and colour plus occupancy masks, and generates moves set-wise
+Squares are indexed row * 8 + col, the same order as the 8x8 board list, so bit 0 is a8 and bit 63 is h1
+Making and undoing a move only touches the bitboards and a flat 64-square list
+The 8x8 board list the UI and the AI read is rebuilt from the flat list when it is asked for
+"""
+
+import ChessEngine
+
+PIECES = ("wP", "wR", "wN", "wB", "wQ", "wK", "bP", "bR", "bN", "bB", "bQ", "bK")
+ALL_SQUARES = (1 << 64) - 1
+
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (-1, -2), (1, -2), (1, 2), (2, -1), (2, 1), (-1, 2))
+KING_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+
+
+# bitboard of every square reachable from each square with one of the given offsets
+def BuildLeaperAttacks(offsets):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        bb = 0
+        for dr, dc in offsets:
+            if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                bb |= 1 << ((r + dr) * 8 + c + dc)
+        table.append(bb)
+    return table
+
+
+# bitboard of every square in one direction from each square, not including the square itself
+def BuildRays(direction):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        bb = 0
+        for i in range(1, 8):
+            endRow, endCol = r + direction[0] * i, c + direction[1] * i
+            if not (0 <= endRow < 8 and 0 <= endCol < 8):
+                break
+            bb |= 1 << (endRow * 8 + endCol)
+        table.append(bb)
+    return table
+
+
+KNIGHT_ATTACKS = BuildLeaperAttacks(KNIGHT_OFFSETS)
+KING_ATTACKS = BuildLeaperAttacks(KING_OFFSETS)
+# squares a pawn of the given colour attacks from each square
+PAWN_ATTACKS = {"w": BuildLeaperAttacks(((-1, -1), (-1, 1))), "b": BuildLeaperAttacks(((1, -1), (1, 1)))}
+
+RAYS = {d: BuildRays(d) for d in ROOK_DIRECTIONS + BISHOP_DIRECTIONS}
+# (ray table, True if the ray runs towards higher square indices) for each direction
+# the first blocker on a ray is the lowest set bit for increasing rays and the highest set bit otherwise
+ROOK_RAYS = tuple((RAYS[d], d[0] * 8 + d[1] > 0) for d in ROOK_DIRECTIONS)
+BISHOP_RAYS = tuple((RAYS[d], d[0] * 8 + d[1] > 0) for d in BISHOP_DIRECTIONS)
+
+
+# between[a][b] is the squares strictly between a and b if they share a line, otherwise 0
+# line[a][b] is the whole line through a and b if they share a line, otherwise 0
+def BuildLines():
+    between = [[0] * 64 for _ in range(64)]
+    line = [[0] * 64 for _ in range(64)]
+    for d, ray in RAYS.items():
+        opposite = RAYS[(-d[0], -d[1])]
+        for a in range(64):
+            for b in Squares(ray[a]):
+                between[a][b] = ray[a] & opposite[b]
+                line[a][b] = ray[a] | opposite[a] | (1 << a)
+    return between, line
+
+
+# squares that must be empty and squares that must not be attacked for each castle
+WHITE_KINGSIDE_EMPTY, WHITE_KINGSIDE_SAFE = (1 << 61) | (1 << 62), (1 << 61) | (1 << 62)
+WHITE_QUEENSIDE_EMPTY, WHITE_QUEENSIDE_SAFE = (1 << 57) | (1 << 58) | (1 << 59), (1 << 58) | (1 << 59)
+BLACK_KINGSIDE_EMPTY, BLACK_KINGSIDE_SAFE = (1 << 5) | (1 << 6), (1 << 5) | (1 << 6)
+BLACK_QUEENSIDE_EMPTY, BLACK_QUEENSIDE_SAFE = (1 << 1) | (1 << 2) | (1 << 3), (1 << 2) | (1 << 3)
+
+RANK_3, RANK_6 = 0xFF << 40, 0xFF << 16
+PROMOTION_RANKS = {"w": 0xFF, "b": 0xFF << 56}
+
+
+def SlidingAttacks(sq, occupied, rays):
+    attacks = 0
+    for table, increasing in rays:
+        ray = table[sq]
+        blockers = ray & occupied
+        if blockers:
+            if increasing:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= table[blocker]  # cut the ray off behind the first blocker
+        attacks |= ray
+    return attacks
+
+
+def RookAttacks(sq, occupied):
+    return SlidingAttacks(sq, occupied, ROOK_RAYS)
+
+
+def BishopAttacks(sq, occupied):
+    return SlidingAttacks(sq, occupied, BISHOP_RAYS)
+
+
+# yields the index of every set bit, lowest first
+def Squares(bb):
+    while bb:
+        bit = bb & -bb
+        yield bit.bit_length() - 1
+        bb ^= bit
+
+
+BETWEEN, LINE = BuildLines()
+
+
+class BitboardGameState(ChessEngine.GameState):
+    def __init__(self):
+        self.squares = ["--"] * 64  # piece on each square, indexed like the bits
+        self.boardList = None  # 8x8 view of squares, None until it is read after a move
+        super().__init__()
+        self.bitboards = {}
+        self.occupancy = {}
+        self.occupied = 0
+        self.LoadBitboards()
+
+    # the 8x8 board list, built from the flat squares only when something reads it
+    @property
+    def board(self):
+        if self.boardList is None:
+            squares = self.squares
+            self.boardList = [squares[i:i + 8] for i in range(0, 64, 8)]
+        return self.boardList
+
+    @board.setter
+    def board(self, rows):
+        self.squares = [piece for row in rows for piece in row]
+        self.boardList = None
+
+    # rebuild every bitboard from the flat squares
+    def LoadBitboards(self):
+        self.bitboards = {piece: 0 for piece in PIECES}
+        for sq, piece in enumerate(self.squares):
+            if piece != "--":
+                self.bitboards[piece] |= 1 << sq
+        self.occupancy = {"w": 0, "b": 0}
+        for piece, bb in self.bitboards.items():
+            self.occupancy[piece[0]] |= bb
+        self.occupied = self.occupancy["w"] | self.occupancy["b"]
+
+    def FenString(self, fen=None):
+        result = super().FenString(fen)
+        if fen is not None:
+            self.LoadBitboards()
+        return result
+
+    def MovePieces(self, move):
+        squares = self.squares
+        start, end = move.startRow * 8 + move.startCol, move.endRow * 8 + move.endCol
+        squares[start] = "--"
+        squares[end] = move.pieceMoved[0] + "Q" if move.isPawnPromotion else move.pieceMoved
+        if move.isEnpassantMove:
+            squares[move.startRow * 8 + move.endCol] = "--"
+        if move.isCastleMove:
+            rookFrom, rookTo = (end + 1, end - 1) if move.endCol - move.startCol == 2 else (end - 2, end + 1)
+            squares[rookTo] = squares[rookFrom]
+            squares[rookFrom] = "--"
+        self.boardList = None
+        self.ToggleMoveBits(move)
+
+    def UnmovePieces(self, move):
+        squares = self.squares
+        start, end = move.startRow * 8 + move.startCol, move.endRow * 8 + move.endCol
+        squares[start] = move.pieceMoved
+        if move.isEnpassantMove:
+            squares[end] = "--"
+            squares[move.startRow * 8 + move.endCol] = move.pieceCaptured
+        else:
+            squares[end] = move.pieceCaptured
+        if move.isCastleMove:
+            rookFrom, rookTo = (end + 1, end - 1) if move.endCol - move.startCol == 2 else (end - 2, end + 1)
+            squares[rookFrom] = squares[rookTo]
+            squares[rookTo] = "--"
+        self.boardList = None
+        self.ToggleMoveBits(move)
+
+    # flip the bits a move changes - applying it twice restores the position, so make and undo share it
+    def ToggleMoveBits(self, move):
+        colour = move.pieceMoved[0]
+        start = 1 << (move.startRow * 8 + move.startCol)
+        end = 1 << (move.endRow * 8 + move.endCol)
+        self.bitboards[move.pieceMoved] ^= start
+        self.bitboards[colour + "Q" if move.isPawnPromotion else move.pieceMoved] ^= end
+        changed = start | end
+        if move.pieceCaptured != "--":
+            captured = 1 << ((move.startRow if move.isEnpassantMove else move.endRow) * 8 + move.endCol)
+            self.bitboards[move.pieceCaptured] ^= captured
+            self.occupancy[move.pieceCaptured[0]] ^= captured
+        if move.isCastleMove:
+            if move.endCol - move.startCol == 2:  # kingside
+                rook = (1 << (move.endRow * 8 + 7)) | (1 << (move.endRow * 8 + 5))
+            else:  # queenside
+                rook = (1 << (move.endRow * 8)) | (1 << (move.endRow * 8 + 3))
+            self.bitboards[colour + "R"] ^= rook
+            changed |= rook
+        self.occupancy[colour] ^= changed
+        self.occupied = self.occupancy["w"] | self.occupancy["b"]
+
+    # bitboard of the pieces of the given colour that attack sq, given the occupancy
+    def AttackersOf(self, sq, colour, occupied):
+        bb = self.bitboards
+        queens = bb[colour + "Q"]
+        return (KNIGHT_ATTACKS[sq] & bb[colour + "N"]) | \
+               (KING_ATTACKS[sq] & bb[colour + "K"]) | \
+               (PAWN_ATTACKS["b" if colour == "w" else "w"][sq] & bb[colour + "P"]) | \
+               (RookAttacks(sq, occupied) & (bb[colour + "R"] | queens)) | \
+               (BishopAttacks(sq, occupied) & (bb[colour + "B"] | queens))
+
+    # bitboard of every square the given colour attacks, given the occupancy
+    def AttackMap(self, colour, occupied):
+        bb = self.bitboards
+        pawns = bb[colour + "P"]
+        if colour == "w":
+            attacks = ((pawns >> 9) & ~0x8080808080808080) | ((pawns >> 7) & ~0x0101010101010101)
+        else:
+            attacks = ((pawns << 7) & ~0x8080808080808080) | ((pawns << 9) & ~0x0101010101010101)
+        attacks &= ALL_SQUARES
+        for sq in Squares(bb[colour + "N"]):
+            attacks |= KNIGHT_ATTACKS[sq]
+        for sq in Squares(bb[colour + "K"]):
+            attacks |= KING_ATTACKS[sq]
+        for sq in Squares(bb[colour + "R"] | bb[colour + "Q"]):
+            attacks |= RookAttacks(sq, occupied)
+        for sq in Squares(bb[colour + "B"] | bb[colour + "Q"]):
+            attacks |= BishopAttacks(sq, occupied)
+        return attacks
+
+    def SquareAttackedBy(self, r, c, byWhite):
+        return self.AttackersOf(r * 8 + c, "w" if byWhite else "b", self.occupied) != 0
+
+    def GetAttackMap(self, byWhite):
+        attacks = self.AttackMap("w" if byWhite else "b", self.occupied)
+        return [[(attacks >> (r * 8 + c)) & 1 == 1 for c in range(8)] for r in range(8)]
+
+    def InCheck(self):
+        us, them = ("w", "b") if self.whiteToMove else ("b", "w")
+        kingSq = self.bitboards[us + "K"].bit_length() - 1
+        return self.AttackersOf(kingSq, them, self.occupied) != 0
+
+    def AmIInCheck(self):
+        return self.InCheck()
+
+    # All moves considering checks - pins and checks are worked out up front so no move has to be made and undone
+    # with pinAwareMoveGeneration off it falls back to the list generator's make/undo filter, run on the bitboards'
+    # make, undo and check test, to cross-check them with perft
+    def GetValidMoves(self):
+        if not self.pinAwareMoveGeneration:
+            return self.GetValidMovesByMakeUndo()
+        return self.GetLegalMoves(ChessEngine.ALL_MOVES)
+
+    def GetCaptureMoves(self):
+        return self.GetLegalMoves(ChessEngine.CAPTURE_MOVES)
+
+    def GetQuietMoves(self):
+        return self.GetLegalMoves(ChessEngine.QUIET_MOVES)
+
+    # square limits the moves to those of the piece on that (row, col)
+    def GetLegalMoves(self, mode, square=None):
+        moves = []
+        us, them = ("w", "b") if self.whiteToMove else ("b", "w")
+        bb = self.bitboards
+        ours, theirs, occupied = self.occupancy[us], self.occupancy[them], self.occupied
+        king = bb[us + "K"]
+        kingSq = king.bit_length() - 1
+        pieces = ours if square is None else (1 << (square[0] * 8 + square[1])) & ours
+
+        checkers = self.AttackersOf(kingSq, them, occupied)
+        # squares pieces may move to - enemy pieces for captures, empty squares for quiet moves
+        if mode == ChessEngine.CAPTURE_MOVES:
+            targets = theirs
+        elif mode == ChessEngine.QUIET_MOVES:
+            targets = ~occupied & ALL_SQUARES
+        else:
+            targets = ~ours & ALL_SQUARES
+        danger = 0
+        if king & pieces:
+            # the king can't step back along the line of a slider, so leave it out of the occupancy
+            danger = self.AttackMap(them, occupied ^ king)
+            self.AddMoves(kingSq, KING_ATTACKS[kingSq] & targets & ~danger, moves)
+
+        checkCount = bin(checkers).count("1")
+        if checkCount > 1:  # double check - only the king can move
+            self.SetGameOver(moves, True, mode, square)
+            return moves
+        if checkCount == 1:  # single check - capture the checker or block the line
+            checkMask = checkers | BETWEEN[kingSq][checkers.bit_length() - 1]
+        else:
+            checkMask = ALL_SQUARES
+
+        # pinned pieces may only move along the line between the king and the pinning piece
+        pinLines = {}
+        snipers = (RookAttacks(kingSq, 0) & (bb[them + "R"] | bb[them + "Q"])) | \
+                  (BishopAttacks(kingSq, 0) & (bb[them + "B"] | bb[them + "Q"]))
+        for sniperSq in Squares(snipers):
+            blockers = BETWEEN[kingSq][sniperSq] & occupied
+            if blockers and blockers & (blockers - 1) == 0 and blockers & ours:
+                pinLines[blockers.bit_length() - 1] = LINE[kingSq][sniperSq]
+
+        targets &= checkMask
+        for sq in Squares(bb[us + "N"] & pieces):
+            if sq not in pinLines:  # a pinned knight can never move
+                self.AddMoves(sq, KNIGHT_ATTACKS[sq] & targets, moves)
+        for sq in Squares((bb[us + "B"] | bb[us + "Q"]) & pieces):
+            self.AddMoves(sq, BishopAttacks(sq, occupied) & targets & pinLines.get(sq, ALL_SQUARES), moves)
+        for sq in Squares((bb[us + "R"] | bb[us + "Q"]) & pieces):
+            self.AddMoves(sq, RookAttacks(sq, occupied) & targets & pinLines.get(sq, ALL_SQUARES), moves)
+
+        self.GetPawnBitboardMoves(us, them, kingSq, checkMask, pinLines, mode, bb[us + "P"] & pieces, moves)
+        if checkCount == 0 and mode != ChessEngine.CAPTURE_MOVES and king & pieces:
+            self.GetCastleBitboardMoves(kingSq, danger, moves)
+
+        self.SetGameOver(moves, checkCount > 0, mode, square)
+        return moves
+
+    def SetGameOver(self, moves, inCheck, mode, square):
+        if mode != ChessEngine.ALL_MOVES or square is not None:  # a partial move list says nothing about the game
+            return
+        self.checkmate = len(moves) == 0 and inCheck
+        self.stalemate = len(moves) == 0 and not inCheck
+
+    # add a Move from sq to every square in the target bitboard
+    def AddMoves(self, sq, targets, moves):
+        squares = self.squares
+        piece = squares[sq]
+        fromSquares = ChessEngine.Move.FromSquares
+        for endSq in Squares(targets):
+            moves.append(fromSquares(sq, endSq, piece, squares[endSq]))
+
+    def GetPawnBitboardMoves(self, us, them, kingSq, checkMask, pinLines, mode, pawns, moves):
+        empty = ~self.occupied & ALL_SQUARES
+        if mode == ChessEngine.CAPTURE_MOVES:  # only pushes that promote
+            pushTargets = PROMOTION_RANKS[us]
+        elif mode == ChessEngine.QUIET_MOVES:  # every push but promotions, and no captures
+            pushTargets = ALL_SQUARES & ~PROMOTION_RANKS[us]
+        else:
+            pushTargets = ALL_SQUARES
+        theirs = self.occupancy[them] if mode != ChessEngine.QUIET_MOVES else 0
+        forward = -8 if us == "w" else 8
+        doubleRank = RANK_3 if us == "w" else RANK_6
+        for sq in Squares(pawns):
+            allowed = checkMask & pinLines.get(sq, ALL_SQUARES)
+            single = (1 << (sq + forward)) & empty
+            pushes = single
+            if single & doubleRank:
+                pushes |= (1 << (sq + 2 * forward)) & empty
+            self.AddMoves(sq, ((pushes & pushTargets) | (PAWN_ATTACKS[us][sq] & theirs)) & allowed, moves)
+
+            if self.enPassantPossible != () and mode != ChessEngine.QUIET_MOVES:
+                epSq = self.enPassantPossible[0] * 8 + self.enPassantPossible[1]
+                if PAWN_ATTACKS[us][sq] & (1 << epSq) and self.EnPassantIsLegal(sq, epSq, us, them, kingSq):
+                    moves.append(ChessEngine.Move.FromSquares(sq, epSq, us + "P", "--", isEnpassantMove=True))
+
+    # en passant removes two pieces from one rank, so play it out on the occupancy and look for attacks on the king
+    def EnPassantIsLegal(self, sq, epSq, us, them, kingSq):
+        bb = self.bitboards
+        capturedBit = 1 << (epSq - (-8 if us == "w" else 8))
+        occupied = (self.occupied ^ (1 << sq) ^ capturedBit) | (1 << epSq)
+        queens = bb[them + "Q"]
+        return not ((RookAttacks(kingSq, occupied) & (bb[them + "R"] | queens)) or
+                    (BishopAttacks(kingSq, occupied) & (bb[them + "B"] | queens)) or
+                    (KNIGHT_ATTACKS[kingSq] & bb[them + "N"]) or
+                    (PAWN_ATTACKS[us][kingSq] & bb[them + "P"] & ~capturedBit))
+
+    def GetCastleBitboardMoves(self, kingSq, danger, moves):
+        rights = self.currentCastlingRights
+        if self.whiteToMove:
+            kingside = rights.wks, WHITE_KINGSIDE_EMPTY, WHITE_KINGSIDE_SAFE
+            queenside = rights.wqs, WHITE_QUEENSIDE_EMPTY, WHITE_QUEENSIDE_SAFE
+        else:
+            kingside = rights.bks, BLACK_KINGSIDE_EMPTY, BLACK_KINGSIDE_SAFE
+            queenside = rights.bqs, BLACK_QUEENSIDE_EMPTY, BLACK_QUEENSIDE_SAFE
+        king = self.squares[kingSq]
+        for (allowed, empty, safe), endSq in ((kingside, kingSq + 2), (queenside, kingSq - 2)):
+            if allowed and not (self.occupied & empty) and not (danger & safe):
+                moves.append(ChessEngine.Move.FromSquares(kingSq, endSq, king, "--", isCastleMove=True))
@@ -1,6 +1,12 @@
+import collections
+
 import pygame
 
+TEXT_CACHE_SIZE = 256  # rendered text surfaces kept, the least recently used goes first
+
 _circle_cache = {}
+_font_cache = {}
+_text_cache = collections.OrderedDict()
 
 
 def _circlepoints(r):
@@ -24,7 +30,38 @@ def _circlepoints(r):
     return points
 
 
+# a SysFont made once for each (name, size, bold, italic)
+def GetFont(name, size, bold=False, italic=False):
+    key = (name, size, bold, italic)
+    if key not in _font_cache:
+        _font_cache[key] = pygame.font.SysFont(name, size, bold, italic)
+    return _font_cache[key]
+
+
+# the text surface from the cache, or made by render and cached under key
+def _cached(key, render):
+    if key in _text_cache:
+        _text_cache.move_to_end(key)
+        return _text_cache[key]
+    surface = _text_cache[key] = render()
+    if len(_text_cache) > TEXT_CACHE_SIZE:
+        _text_cache.popitem(last=False)
+    return surface
+
+
+# Render and RenderText hand out the cached surface itself, copy it before changing it (set_alpha and so on)
 def Render(text, font, gfcolor=pygame.Color('dodgerblue'), ocolor=(255, 255, 255), opx=2):
+    key = (text, font, tuple(pygame.Color(gfcolor)), tuple(pygame.Color(ocolor)), opx)
+    return _cached(key, lambda: _render(text, font, gfcolor, ocolor, opx))
+
+
+# plain antialiased text without an outline
+def RenderText(text, font, color):
+    key = (text, font, tuple(pygame.Color(color)), None)
+    return _cached(key, lambda: font.render(text, True, color))
+
+
+def _render(text, font, gfcolor, ocolor, opx):
     textsurface = font.render(text, True, gfcolor).convert_alpha()
     w = textsurface.get_width() + 2 * opx
     h = font.get_height()
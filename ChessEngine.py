@@ -4,6 +4,28 @@ Also responsible for determining the valid moves at current state
 Also keeps a move log
 """
 
+import random
+
+from Evaluation import pieceSquareScores
+
+KNIGHT_MOVES = ((-2, -1), (-2, 1), (-1, -2), (1, -2), (1, 2), (2, -1), (2, 1), (-1, 2))
+KING_MOVES = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+# which moves the generators produce - CAPTURE_MOVES includes promotions, QUIET_MOVES is everything else
+ALL_MOVES, CAPTURE_MOVES, QUIET_MOVES = 0, 1, 2
+# pieces that attack a square, indexed by whether they are white: pawn, knight, bishop, rook, queen, king
+ATTACKERS = {True: ("wP", "wN", "wB", "wR", "wQ", "wK"), False: ("bP", "bN", "bB", "bR", "bQ", "bK")}
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# Zobrist keys - a fixed seed keeps position keys the same in every process and every run
+_zobristRandom = random.Random(0x5EED)
+ZOBRIST_PIECES = {piece: [_zobristRandom.getrandbits(64) for _ in range(64)]
+                  for piece in ("wP", "wN", "wB", "wR", "wQ", "wK", "bP", "bN", "bB", "bR", "bQ", "bK")}
+ZOBRIST_BLACK_TO_MOVE = _zobristRandom.getrandbits(64)
+ZOBRIST_CASTLING = [_zobristRandom.getrandbits(64) for _ in range(16)]  # indexed by CastleRights.Index()
+ZOBRIST_EN_PASSANT = [_zobristRandom.getrandbits(64) for _ in range(8)]  # indexed by file
+
 
 class GameState:
     def __init__(self):
@@ -34,23 +56,64 @@ class GameState:
         self.currentCastlingRights = CastleRights(True, True, True, True)
         self.castleRightsLog = [CastleRights(self.currentCastlingRights.wks, self.currentCastlingRights.bks,
                                              self.currentCastlingRights.wqs, self.currentCastlingRights.bqs)]
-
-    # Fen string manager
+        # False falls back to making and undoing every pseudo-legal move, kept to cross-check with perft
+        self.pinAwareMoveGeneration = True
+        self.pins = []  # (row, col, dirRow, dirCol) of each pinned piece, only set while generating moves
+        self.generationMode = ALL_MOVES  # CAPTURE_MOVES makes the piece generators skip quiet moves
+        self.zobristKey = self.ComputeZobristKey()  # 64-bit position key, updated by MakeMove and UndoMove
+        self.zobristKeyLog = []
+        self.boardScore = self.ComputeBoardScore()  # material plus position in tenths of a pawn, + is good for white
+        self.boardScoreLog = []
+        self.pieceCount = 32  # pieces on the board, kings included, updated by MakeMove and UndoMove
+        self.startHalfmoveClock = 0  # move counters of the position the game started from
+        self.startFullmoveNumber = 1
+
+    # Fen string manager - sets up the position from a FEN, or returns the position as one
+    # fields left off the end of a FEN default to white to move, no castling, no en passant square and move 1
     def FenString(self, fen=None):
         if fen is not None:  # converting to fen string
-            self.board = []
-            for row in fen.split("/"):
+            fields = fen.split()
+            board = []
+            for row in fields[0].split("/"):
                 brow = []
                 for c in row:
-                    if c == " ":
-                        break
-                    elif c in "12345678":
+                    if c in "12345678":
                         brow.extend(["--"] * int(c))
                     elif c > "Z":
                         brow.append("b" + c.upper())
                     else:
                         brow.append("w" + c)
-                self.board.append(brow)
+                board.append(brow)
+            self.board = board
+            for r in range(8):
+                for c in range(8):
+                    if self.board[r][c] == "wK":
+                        self.whiteKingLocation = (r, c)
+                    elif self.board[r][c] == "bK":
+                        self.blackKingLocation = (r, c)
+
+            self.whiteToMove = len(fields) < 2 or fields[1] == "w"
+            rights = fields[2] if len(fields) > 2 else "-"
+            self.currentCastlingRights = CastleRights("K" in rights, "k" in rights, "Q" in rights, "q" in rights)
+            self.castleRightsLog = [CastleRights(self.currentCastlingRights.wks, self.currentCastlingRights.bks,
+                                                 self.currentCastlingRights.wqs, self.currentCastlingRights.bqs)]
+            square = fields[3] if len(fields) > 3 else "-"
+            if square == "-":
+                self.enPassantPossible = ()
+            else:
+                self.enPassantPossible = (Move.ranksToRows[square[1]], Move.filesToCols[square[0]])
+            self.enPassantPossibleLog = [self.enPassantPossible]
+            self.startHalfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+            self.startFullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+
+            self.moveLog = []
+            self.checkmate = False
+            self.stalemate = False
+            self.zobristKey = self.ComputeZobristKey()
+            self.zobristKeyLog = []
+            self.boardScore = self.ComputeBoardScore()
+            self.boardScoreLog = []
+            self.pieceCount = 64 - sum(row.count("--") for row in self.board)
 
         else:  # updating from fen string
             fen = ""
@@ -68,13 +131,72 @@ class GameState:
                 if empty > 0:
                     fen = f"{fen}{empty}"
                 fen = f"{fen}/"
-            return fen[:-1]
+            rights = self.currentCastlingRights
+            castling = "".join(letter for letter, allowed in zip("KQkq", (rights.wks, rights.wqs, rights.bks, rights.bqs))
+                               if allowed) or "-"
+            square = "-"
+            if self.enPassantPossible != ():
+                square = Move.colsToFiles[self.enPassantPossible[1]] + Move.rowsToRanks[self.enPassantPossible[0]]
+            return f"{fen[:-1]} {'w' if self.whiteToMove else 'b'} {castling} {square} " \
+                   f"{self.HalfmoveClock()} {self.FullmoveNumber()}"
+
+    # plies since the last capture or pawn move, for the fifty-move rule
+    def HalfmoveClock(self):
+        for plies, move in enumerate(reversed(self.moveLog)):
+            if move.isCapture or move.pieceMoved[1] == "P":
+                return plies
+        return self.startHalfmoveClock + len(self.moveLog)
+
+    # starts at 1 and goes up after each black move
+    def FullmoveNumber(self):
+        blackStarted = self.whiteToMove == (len(self.moveLog) % 2 == 1)
+        return self.startFullmoveNumber + (len(self.moveLog) + blackStarted) // 2
+
+    # hash the whole position from scratch - MakeMove and UndoMove keep it up to date after this
+    def ComputeZobristKey(self):
+        key = 0
+        for r in range(8):
+            for c in range(8):
+                if self.board[r][c] != "--":
+                    key ^= ZOBRIST_PIECES[self.board[r][c]][r * 8 + c]
+        if not self.whiteToMove:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        key ^= ZOBRIST_CASTLING[self.currentCastlingRights.Index()]
+        if self.enPassantPossible != ():
+            key ^= ZOBRIST_EN_PASSANT[self.enPassantPossible[1]]
+        return key
+
+    # score the whole board from scratch - MakeMove and UndoMove keep it up to date after this
+    def ComputeBoardScore(self):
+        score = 0
+        for r in range(8):
+            for c in range(8):
+                if self.board[r][c] != "--":
+                    score += pieceSquareScores[self.board[r][c]][r * 8 + c]
+        return score
 
     # takes a Move as a parameter and executes it
 
     def MakeMove(self, move):
-        self.board[move.startRow][move.startCol] = "--"  # no piece at old pos
-        self.board[move.endRow][move.endCol] = move.pieceMoved  # new piece at new pos
+        # take the old side to move, castling rights and en passant square out of the key
+        self.zobristKeyLog.append(self.zobristKey)
+        key = self.zobristKey ^ ZOBRIST_BLACK_TO_MOVE ^ ZOBRIST_CASTLING[self.currentCastlingRights.Index()]
+        if self.enPassantPossible != ():
+            key ^= ZOBRIST_EN_PASSANT[self.enPassantPossible[1]]
+        key ^= ZOBRIST_PIECES[move.pieceMoved][move.startRow * 8 + move.startCol] ^ \
+            ZOBRIST_PIECES[move.pieceMoved][move.endRow * 8 + move.endCol]
+        if move.pieceCaptured != "--" and not move.isEnpassantMove:
+            key ^= ZOBRIST_PIECES[move.pieceCaptured][move.endRow * 8 + move.endCol]
+        self.boardScoreLog.append(self.boardScore)
+        placedPiece = move.pieceMoved[0] + "Q" if move.isPawnPromotion else move.pieceMoved
+        self.boardScore += pieceSquareScores[placedPiece][move.endRow * 8 + move.endCol] - \
+            pieceSquareScores[move.pieceMoved][move.startRow * 8 + move.startCol]
+        if move.pieceCaptured != "--":
+            captureRow = move.startRow if move.isEnpassantMove else move.endRow
+            self.boardScore -= pieceSquareScores[move.pieceCaptured][captureRow * 8 + move.endCol]
+            self.pieceCount -= 1
+
+        self.MovePieces(move)
         self.moveLog.append(move)  # add move to move log
         self.whiteToMove = not self.whiteToMove  # swap players
 
@@ -86,11 +208,12 @@ class GameState:
 
         # pawn promotion
         if move.isPawnPromotion:
-            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + "Q"
+            key ^= ZOBRIST_PIECES[move.pieceMoved][move.endRow * 8 + move.endCol] ^ \
+                ZOBRIST_PIECES[move.pieceMoved[0] + "Q"][move.endRow * 8 + move.endCol]
 
         # en passant
         if move.isEnpassantMove:
-            self.board[move.startRow][move.endCol] = "--"  # capturing the pawn
+            key ^= ZOBRIST_PIECES[move.pieceCaptured][move.startRow * 8 + move.endCol]
 
         # update enpassantPossible variable
         if move.pieceMoved[1] == "P" and abs(move.startRow - move.endRow) == 2:  # only on 2 square pawn advances
@@ -102,24 +225,60 @@ class GameState:
 
         # castling
         if move.isCastleMove:
+            rookKeys = ZOBRIST_PIECES[move.pieceMoved[0] + "R"]
+            rookScores = pieceSquareScores[move.pieceMoved[0] + "R"]
             if move.endCol - move.startCol == 2:  # moved kingside
-                self.board[move.endRow][move.endCol - 1] = self.board[move.endRow][move.endCol + 1]  # move rook
-                self.board[move.endRow][move.endCol + 1] = "--"  # erase old pos rook
+                rookFrom, rookTo = move.endRow * 8 + move.endCol + 1, move.endRow * 8 + move.endCol - 1
             else:  # moved queenside
-                self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 2]  # move rook
-                self.board[move.endRow][move.endCol - 2] = "--"
+                rookFrom, rookTo = move.endRow * 8 + move.endCol - 2, move.endRow * 8 + move.endCol + 1
+            key ^= rookKeys[rookFrom] ^ rookKeys[rookTo]
+            self.boardScore += rookScores[rookTo] - rookScores[rookFrom]
 
         # update castling rights - whenever it is a rook or a king move
         self.UpdateCastleRights(move)
         self.castleRightsLog.append(CastleRights(self.currentCastlingRights.wks, self.currentCastlingRights.bks,
                                                  self.currentCastlingRights.wqs, self.currentCastlingRights.bqs))
 
+        # put the new castling rights and en passant square into the key
+        key ^= ZOBRIST_CASTLING[self.currentCastlingRights.Index()]
+        if self.enPassantPossible != ():
+            key ^= ZOBRIST_EN_PASSANT[self.enPassantPossible[1]]
+        self.zobristKey = key
+
+    # puts the pieces where the move leaves them, including the rook of a castle and the pawn taken en passant
+    def MovePieces(self, move):
+        self.board[move.startRow][move.startCol] = "--"  # no piece at old pos
+        self.board[move.endRow][move.endCol] = move.pieceMoved[0] + "Q" if move.isPawnPromotion else move.pieceMoved
+        if move.isEnpassantMove:
+            self.board[move.startRow][move.endCol] = "--"  # capturing the pawn
+        if move.isCastleMove:
+            if move.endCol - move.startCol == 2:  # moved kingside
+                self.board[move.endRow][move.endCol - 1] = self.board[move.endRow][move.endCol + 1]  # move rook
+                self.board[move.endRow][move.endCol + 1] = "--"  # erase old pos rook
+            else:  # moved queenside
+                self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 2]  # move rook
+                self.board[move.endRow][move.endCol - 2] = "--"
+
+    # puts the pieces back where they were before the move
+    def UnmovePieces(self, move):
+        self.board[move.startRow][move.startCol] = move.pieceMoved  # no piece at old pos
+        self.board[move.endRow][move.endCol] = move.pieceCaptured  # new piece at new pos
+        if move.isEnpassantMove:
+            self.board[move.endRow][move.endCol] = "--"  # leave landing square blank
+            self.board[move.startRow][move.endCol] = move.pieceCaptured
+        if move.isCastleMove:
+            if move.endCol - move.startCol == 2:  # kingside
+                self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 1]
+                self.board[move.endRow][move.endCol - 1] = "--"
+            else:  # queenside
+                self.board[move.endRow][move.endCol - 2] = self.board[move.endRow][move.endCol + 1]
+                self.board[move.endRow][move.endCol + 1] = "--"
+
     # undo the last move
     def UndoMove(self):
         if len(self.moveLog) != 0:  # make sure you can undo
             move = self.moveLog.pop(-1)
-            self.board[move.startRow][move.startCol] = move.pieceMoved  # no piece at old pos
-            self.board[move.endRow][move.endCol] = move.pieceCaptured  # new piece at new pos
+            self.UnmovePieces(move)
             self.whiteToMove = not self.whiteToMove  # swap players
 
             # update kings location
@@ -127,9 +286,6 @@ class GameState:
                 self.whiteKingLocation = (move.startRow, move.startCol)
             elif move.pieceMoved == "bK":
                 self.blackKingLocation = (move.startRow, move.startCol)
-            if move.isEnpassantMove:
-                self.board[move.endRow][move.endCol] = "--"  # leave landing square blank
-                self.board[move.startRow][move.endCol] = move.pieceCaptured
 
             self.enPassantPossibleLog.pop()
             self.enPassantPossible = self.enPassantPossibleLog[-1]
@@ -138,14 +294,11 @@ class GameState:
             self.castleRightsLog.pop()  # get rid of new castle rights from the move we are undoing
             self.currentCastlingRights = CastleRights(self.castleRightsLog[-1].wks, self.castleRightsLog[-1].bks,
                                                       self.castleRightsLog[-1].wqs, self.castleRightsLog[-1].bqs)
-            # undo castle move
-            if move.isCastleMove:
-                if move.endCol - move.startCol == 2:  # kingside
-                    self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 1]
-                    self.board[move.endRow][move.endCol - 1] = "--"
-                else:  # queenside
-                    self.board[move.endRow][move.endCol - 2] = self.board[move.endRow][move.endCol + 1]
-                    self.board[move.endRow][move.endCol + 1] = "--"
+
+            self.zobristKey = self.zobristKeyLog.pop()
+            self.boardScore = self.boardScoreLog.pop()
+            if move.pieceCaptured != "--":
+                self.pieceCount += 1
 
             self.checkmate = False
             self.stalemate = False
@@ -187,6 +340,166 @@ class GameState:
 
     # All moves considering checks
     def GetValidMoves(self):
+        if not self.pinAwareMoveGeneration:
+            return self.GetValidMovesByMakeUndo()
+        return self.GetLegalMoves(ALL_MOVES)
+
+    # Captures and promotions considering checks, for the quiescence search - checkmate and stalemate aren't updated
+    def GetCaptureMoves(self):
+        return self.GetLegalMoves(CAPTURE_MOVES)
+
+    # Non-capturing, non-promoting moves considering checks - checkmate and stalemate aren't updated
+    def GetQuietMoves(self):
+        return self.GetLegalMoves(QUIET_MOVES)
+
+    # the legal move with this moveID, or None - hash and killer moves can come from other positions, so check them
+    def GetLegalMoveByID(self, moveID):
+        startSq, endSq = Move.UnpackID(moveID)
+        for move in self.GetLegalMoves(ALL_MOVES, divmod(startSq, 8)):
+            if move.moveID == moveID:
+                return move
+        return None
+
+    # the legal move written like "e2e4" or "e7e8q" - promotions are always to a queen, so any other is refused
+    def GetMoveFromCoordinates(self, text):
+        startSq = Move.ranksToRows[text[1]], Move.filesToCols[text[0]]
+        endSq = Move.ranksToRows[text[3]], Move.filesToCols[text[2]]
+        move = self.GetLegalMoveByID(Move.PackID(startSq, endSq))
+        if move is None:
+            raise ValueError(f"illegal move {text}")
+        if move.isPawnPromotion and text[4:].lower() not in ("", "q"):
+            raise ValueError(f"unsupported underpromotion {text}, pawns only promote to a queen")
+        return move
+
+    # square limits the moves to those of the piece on that (row, col)
+    def GetLegalMoves(self, mode, square=None):
+        self.generationMode = mode
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        inCheck, self.pins, checks = self.CheckForPinsAndChecks(kingRow, kingCol)
+        moves = []
+        if square is not None:
+            r, c = square
+            piece = self.board[r][c]
+            if piece[0] == ("w" if self.whiteToMove else "b") and (len(checks) < 2 or piece[1] == "K"):
+                self.moveFunctions[piece[1]](r, c, moves)
+                if piece[1] == "K" and not inCheck and mode != CAPTURE_MOVES:
+                    self.GetCastleMoves(kingRow, kingCol, moves)
+        elif len(checks) > 1:  # double check - only the king can move
+            self.GetKingMoves(kingRow, kingCol, moves)
+        else:
+            moves = self.GetAllPossibleMoves()
+            if not inCheck and mode != CAPTURE_MOVES:
+                self.GetCastleMoves(kingRow, kingCol, moves)
+
+        # with one check the only non-king moves are capturing the checker or blocking its line
+        validSquares = None
+        if len(checks) == 1:
+            checkRow, checkCol, dirRow, dirCol = checks[0]
+            if self.board[checkRow][checkCol][1] == "N":  # knights can't be blocked
+                validSquares = {(checkRow, checkCol)}
+            else:
+                validSquares = set()
+                for i in range(1, 8):
+                    validSquares.add((kingRow + dirRow * i, kingCol + dirCol * i))
+                    if kingRow + dirRow * i == checkRow and kingCol + dirCol * i == checkCol:
+                        break
+
+        legalMoves = []
+        for move in moves:
+            if move.pieceMoved[1] == "K" and not move.isCastleMove:
+                if self.KingSafeAt(move.endRow, move.endCol):
+                    legalMoves.append(move)
+            elif move.isEnpassantMove:  # two pawns leave the rank, so pins alone can't tell
+                if self.EnpassantIsLegal(move):
+                    legalMoves.append(move)
+            elif validSquares is None or (move.endRow, move.endCol) in validSquares:
+                legalMoves.append(move)
+        self.pins = []
+        self.generationMode = ALL_MOVES
+
+        if mode == ALL_MOVES and square is None:  # a partial move list says nothing about the game being over
+            self.checkmate = len(legalMoves) == 0 and inCheck
+            self.stalemate = len(legalMoves) == 0 and not inCheck
+        return legalMoves
+
+    # Looks outward from (r, c) for enemy pieces attacking it and allied pieces pinned against it
+    # returns (inCheck, pins, checks) where pins and checks are (row, col, dirRow, dirCol) from (r, c)
+    def CheckForPinsAndChecks(self, r, c):
+        pins = []
+        checks = []
+        inCheck = False
+        enemyColour, allyColour = ("b", "w") if self.whiteToMove else ("w", "b")
+        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+        for j in range(len(directions)):
+            d = directions[j]
+            possiblePin = ()
+            for i in range(1, 8):
+                endRow = r + d[0] * i
+                endCol = c + d[1] * i
+                if not (0 <= endRow < 8 and 0 <= endCol < 8):  # off board
+                    break
+                endPiece = self.board[endRow][endCol]
+                if endPiece[0] == allyColour and endPiece[1] != "K":
+                    if possiblePin == ():  # first allied piece could be pinned
+                        possiblePin = (endRow, endCol, d[0], d[1])
+                    else:  # second allied piece, so no pin or check in this direction
+                        break
+                elif endPiece[0] == enemyColour:
+                    pieceType = endPiece[1]
+                    # orthogonal rooks, diagonal bishops, queens, kings one square away, and pawns one
+                    # square away diagonally in front of the square
+                    if (0 <= j <= 3 and pieceType == "R") or (4 <= j <= 7 and pieceType == "B") or \
+                            pieceType == "Q" or (i == 1 and pieceType == "K") or \
+                            (i == 1 and pieceType == "P" and ((enemyColour == "w" and 6 <= j <= 7) or
+                                                              (enemyColour == "b" and 4 <= j <= 5))):
+                        if possiblePin == ():
+                            inCheck = True
+                            checks.append((endRow, endCol, d[0], d[1]))
+                        else:
+                            pins.append(possiblePin)
+                    break  # the enemy piece blocks anything behind it
+        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (1, -2), (1, 2), (2, -1), (2, 1), (-1, 2))
+        for m in knightMoves:
+            endRow = r + m[0]
+            endCol = c + m[1]
+            if 0 <= endRow < 8 and 0 <= endCol < 8:
+                endPiece = self.board[endRow][endCol]
+                if endPiece[0] == enemyColour and endPiece[1] == "N":
+                    inCheck = True
+                    checks.append((endRow, endCol, m[0], m[1]))
+        return inCheck, pins, checks
+
+    # Determines if the king of the side to move would be safe on (r, c)
+    def KingSafeAt(self, r, c):
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        king = self.board[kingRow][kingCol]
+        endPiece = self.board[r][c]
+        self.board[kingRow][kingCol] = "--"  # lift the king so it can't block a slider behind it
+        self.board[r][c] = king
+        attacked = self.SquareAttackedBy(r, c, not self.whiteToMove)
+        self.board[r][c] = endPiece
+        self.board[kingRow][kingCol] = king
+        return not attacked
+
+    def EnpassantIsLegal(self, move):
+        self.MakeMove(move)
+        self.whiteToMove = not self.whiteToMove
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        inCheck = self.CheckForPinsAndChecks(kingRow, kingCol)[0]
+        self.whiteToMove = not self.whiteToMove
+        self.UndoMove()
+        return not inCheck
+
+    # direction a piece at (r, c) is pinned along, or None if it isn't pinned
+    def GetPinDirection(self, r, c):
+        for pin in self.pins:
+            if pin[0] == r and pin[1] == c:
+                return pin[2], pin[3]
+        return None
+
+    # All moves considering checks, by making every pseudo-legal move and looking for attacks on the king
+    def GetValidMovesByMakeUndo(self):
+        self.pins = []
         tempEnpassantPossible = self.enPassantPossible
         tempCastleRights = CastleRights(self.currentCastlingRights.wks, self.currentCastlingRights.bks,
                                         self.currentCastlingRights.wqs, self.currentCastlingRights.bqs)
@@ -231,14 +544,89 @@ class GameState:
 
     # Determines if the enemy can attack the square (r, c)
     def SquareUnderAttack(self, r, c):
-        self.whiteToMove = not self.whiteToMove  # switch to opponents turn
-        oppMoves = self.GetAllPossibleMoves()  # get all opponents moves
-        self.whiteToMove = not self.whiteToMove  # switch turn back
-        for move in oppMoves:
-            if move.endRow == r and move.endCol == c:  # square is under attack!
+        return self.SquareAttackedBy(r, c, not self.whiteToMove)
+
+    # Determines if a piece of the given colour attacks (r, c), looking outward from the square
+    def SquareAttackedBy(self, r, c, byWhite):
+        board = self.board
+        pawn, knight, bishop, rook, queen, king = ATTACKERS[byWhite]
+        for dr, dc in KNIGHT_MOVES:
+            endRow = r + dr
+            endCol = c + dc
+            if 0 <= endRow < 8 and 0 <= endCol < 8 and board[endRow][endCol] == knight:
+                return True
+        for dr, dc in KING_MOVES:
+            endRow = r + dr
+            endCol = c + dc
+            if 0 <= endRow < 8 and 0 <= endCol < 8 and board[endRow][endCol] == king:
                 return True
+        pawnRow = r + 1 if byWhite else r - 1  # white pawns attack up the board, black pawns down it
+        if 0 <= pawnRow < 8:
+            if (c - 1 >= 0 and board[pawnRow][c - 1] == pawn) or (c + 1 <= 7 and board[pawnRow][c + 1] == pawn):
+                return True
+        for dr, dc in ROOK_DIRECTIONS:
+            endRow = r + dr
+            endCol = c + dc
+            while 0 <= endRow < 8 and 0 <= endCol < 8:
+                endPiece = board[endRow][endCol]
+                if endPiece != "--":  # first piece on the ray blocks anything behind it
+                    if endPiece == rook or endPiece == queen:
+                        return True
+                    break
+                endRow += dr
+                endCol += dc
+        for dr, dc in BISHOP_DIRECTIONS:
+            endRow = r + dr
+            endCol = c + dc
+            while 0 <= endRow < 8 and 0 <= endCol < 8:
+                endPiece = board[endRow][endCol]
+                if endPiece != "--":
+                    if endPiece == bishop or endPiece == queen:
+                        return True
+                    break
+                endRow += dr
+                endCol += dc
         return False
 
+    # 8x8 list of bools, True for every square a piece of the given colour attacks
+    def GetAttackMap(self, byWhite):
+        attackMap = [[False] * 8 for _ in range(8)]
+        colour = "w" if byWhite else "b"
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece[0] != colour:
+                    continue
+                pieceType = piece[1]
+                if pieceType == "P":
+                    endRow = r - 1 if byWhite else r + 1
+                    if 0 <= endRow < 8:
+                        if c - 1 >= 0:
+                            attackMap[endRow][c - 1] = True
+                        if c + 1 <= 7:
+                            attackMap[endRow][c + 1] = True
+                elif pieceType == "N" or pieceType == "K":
+                    for dr, dc in (KNIGHT_MOVES if pieceType == "N" else KING_MOVES):
+                        if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                            attackMap[r + dr][c + dc] = True
+                else:
+                    if pieceType == "R":
+                        directions = ROOK_DIRECTIONS
+                    elif pieceType == "B":
+                        directions = BISHOP_DIRECTIONS
+                    else:
+                        directions = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+                    for dr, dc in directions:
+                        endRow = r + dr
+                        endCol = c + dc
+                        while 0 <= endRow < 8 and 0 <= endCol < 8:
+                            attackMap[endRow][endCol] = True
+                            if self.board[endRow][endCol] != "--":
+                                break
+                            endRow += dr
+                            endCol += dc
+        return attackMap
+
     def AmIInCheck(self):
         if self.whiteToMove:
             return self.SquareUnderAttack(self.whiteKingLocation[0], self.whiteKingLocation[1])
@@ -258,39 +646,44 @@ class GameState:
 
     # get all pawn moves at row, col, and these to the moves list
     def GetPawnMoves(self, r, c, moves):
+        pinDirection = self.GetPinDirection(r, c)
+        quiets = self.generationMode != CAPTURE_MOVES
+        captures = self.generationMode != QUIET_MOVES
         if self.whiteToMove:  # white pawn moves
-            if self.board[r - 1][c] == "--":  # 1 square pawn advance
+            if self.board[r - 1][c] == "--" and MovesAlongPin(pinDirection, -1, 0) and \
+                    (captures if r - 1 == 0 else quiets):  # 1 square pawn advance, promotions count as captures
                 moves.append(Move((r, c), (r - 1, c), self.board))
                 try:
-                    if self.board[r - 2][c] == "--" and r == 6:  # 2 square pawn advance
+                    if self.board[r - 2][c] == "--" and r == 6 and quiets:  # 2 square pawn advance
                         moves.append(Move((r, c), (r - 2, c), self.board))
                 except:
                     pass
-            if c - 1 >= 0:
+            if captures and c - 1 >= 0 and MovesAlongPin(pinDirection, -1, -1):
                 if self.board[r - 1][c - 1][0] == "b":  # enemy capture to the left
                     moves.append(Move((r, c), (r - 1, c - 1), self.board))
                 elif (r - 1, c - 1) == self.enPassantPossible:
                     moves.append(Move((r, c), (r - 1, c - 1), self.board, isEnpassantMove=True))
-            if c + 1 <= 7:
+            if captures and c + 1 <= 7 and MovesAlongPin(pinDirection, -1, 1):
                 if self.board[r - 1][c + 1][0] == "b":  # enemy capture to the right
                     moves.append(Move((r, c), (r - 1, c + 1), self.board))
                 elif (r - 1, c + 1) == self.enPassantPossible:
                     moves.append(Move((r, c), (r - 1, c + 1), self.board, isEnpassantMove=True))
 
         else:  # black pawn moves
-            if self.board[r + 1][c] == "--":  # 1 square pawn advance
+            if self.board[r + 1][c] == "--" and MovesAlongPin(pinDirection, 1, 0) and \
+                    (captures if r + 1 == 7 else quiets):  # 1 square pawn advance, promotions count as captures
                 moves.append(Move((r, c), (r + 1, c), self.board))
                 try:
-                    if self.board[r + 2][c] == "--" and r == 1:  # 2 square pawn advance
+                    if self.board[r + 2][c] == "--" and r == 1 and quiets:  # 2 square pawn advance
                         moves.append(Move((r, c), (r + 2, c), self.board))
                 except:
                     pass
-            if c - 1 >= 0:
+            if captures and c - 1 >= 0 and MovesAlongPin(pinDirection, 1, -1):
                 if self.board[r + 1][c - 1][0] == "w":  # enemy capture to the left
                     moves.append(Move((r, c), (r + 1, c - 1), self.board))
                 elif (r + 1, c - 1) == self.enPassantPossible:
                     moves.append(Move((r, c), (r + 1, c - 1), self.board, isEnpassantMove=True))
-            if c + 1 <= 7:
+            if captures and c + 1 <= 7 and MovesAlongPin(pinDirection, 1, 1):
                 if self.board[r + 1][c + 1][0] == "w":  # enemy capture to the right
                     moves.append(Move((r, c), (r + 1, c + 1), self.board))
                 elif (r + 1, c + 1) == self.enPassantPossible:
@@ -300,16 +693,23 @@ class GameState:
     def GetRookMoves(self, r, c, moves):
         directions = ((-1, 0), (0, -1), (1, 0), (0, 1))  # up, left, down, right
         enemyColour = "b" if self.whiteToMove else "w"
+        pinDirection = self.GetPinDirection(r, c)
+        quiets = self.generationMode != CAPTURE_MOVES
+        captures = self.generationMode != QUIET_MOVES
         for d in directions:
+            if not MovesAlongPin(pinDirection, d[0], d[1]):
+                continue
             for i in range(1, 8):
                 endRow = r + d[0] * i  # keep moving in direction
                 endCol = c + d[1] * i
                 if 0 <= endRow < 8 and 0 <= endCol < 8:  # check if it is on board
                     endPiece = self.board[endRow][endCol]
                     if endPiece == "--":  # valid empty space
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                        if quiets:
+                            moves.append(Move((r, c), (endRow, endCol), self.board))
                     elif endPiece[0] == enemyColour:  # can capture enemy
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                        if captures:
+                            moves.append(Move((r, c), (endRow, endCol), self.board))
                         break
                     else:  # hit an allied piece
                         break
@@ -320,28 +720,39 @@ class GameState:
     def GetKnightMoves(self, r, c, moves):
         knightMoves = ((-2, -1), (-2, 1), (-1, -2), (1, -2), (1, 2), (2, -1), (2, 1), (-1, 2))  # all knight moves
         allyColour = "w" if self.whiteToMove else "b"
+        if self.GetPinDirection(r, c) is not None:  # a pinned knight can never move
+            return
+        quiets = self.generationMode != CAPTURE_MOVES
+        captures = self.generationMode != QUIET_MOVES
         for m in knightMoves:
             endRow = r + m[0]
             endCol = c + m[1]
             if 0 <= endRow < 8 and 0 <= endCol < 8:
                 endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColour:  # valid empty space
+                if endPiece[0] != allyColour and (quiets if endPiece == "--" else captures):  # empty space or enemy piece
                     moves.append(Move((r, c), (endRow, endCol), self.board))
 
     # get all bishop moves at row, col, and add these to the move list
     def GetBishopMoves(self, r, c, moves):
         directions = ((-1, -1), (-1, 1), (1, -1), (1, 1))  # all diagonal directions
         enemyColour = "b" if self.whiteToMove else "w"
+        pinDirection = self.GetPinDirection(r, c)
+        quiets = self.generationMode != CAPTURE_MOVES
+        captures = self.generationMode != QUIET_MOVES
         for d in directions:
+            if not MovesAlongPin(pinDirection, d[0], d[1]):
+                continue
             for i in range(1, 8):
                 endRow = r + d[0] * i  # keep moving in direction
                 endCol = c + d[1] * i
                 if 0 <= endRow < 8 and 0 <= endCol < 8:  # check if it is on board
                     endPiece = self.board[endRow][endCol]
                     if endPiece == "--":  # valid empty space
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                        if quiets:
+                            moves.append(Move((r, c), (endRow, endCol), self.board))
                     elif endPiece[0] == enemyColour:  # can capture enemy
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                        if captures:
+                            moves.append(Move((r, c), (endRow, endCol), self.board))
                         break
                     else:  # hit an allied piece
                         break
@@ -357,12 +768,14 @@ class GameState:
     def GetKingMoves(self, r, c, moves):
         kingMoves = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
         allyColour = "w" if self.whiteToMove else "b"
+        quiets = self.generationMode != CAPTURE_MOVES
+        captures = self.generationMode != QUIET_MOVES
         for i in range(8):
             endRow = r + kingMoves[i][0]
             endCol = c + kingMoves[i][1]
             if 0 <= endRow < 8 and 0 <= endCol < 8:
                 endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColour:
+                if endPiece[0] != allyColour and (quiets if endPiece == "--" else captures):
                     moves.append(Move((r, c), (endRow, endCol), self.board))
 
     # generate all valid castle moves for the king at (r, c) and add them to the list of moves
@@ -387,6 +800,15 @@ class GameState:
             moves.append(Move((r, c), (r, c - 2), self.board, isCastleMove=True))
 
 
+# a piece pinned along pinDirection may only move along that line, in either direction
+def MovesAlongPin(pinDirection, dirRow, dirCol):
+    return pinDirection is None or pinDirection == (dirRow, dirCol) or pinDirection == (-dirRow, -dirCol)
+
+
+def NodesPerSecond(nodes, seconds):
+    return int(nodes / seconds) if seconds > 0 else 0
+
+
 class CastleRights:
     def __init__(self, wks, bks, wqs, bqs):
         self.wks, self.bks, self.wqs, self.bqs = wks, bks, wqs, bqs  # store current state of castling rights
@@ -394,6 +816,10 @@ class CastleRights:
     def __str__(self):
         return f"{self.wks}, {self.wqs}, {self.bks}, {self.bqs}"
 
+    # the rights as a 4-bit number, used to look up their Zobrist key
+    def Index(self):
+        return self.wks | self.wqs << 1 | self.bks << 2 | self.bqs << 3
+
 
 class Move:
     # maps keys to values
@@ -404,24 +830,30 @@ class Move:
     rowsToRanks = {v: k for k, v in ranksToRows.items()}
     colsToFiles = {v: k for k, v in filesToCols.items()}
 
+    # one fixed set of attributes and no per-move __dict__, generators create hundreds of moves per node
+    __slots__ = ("startRow", "startCol", "endRow", "endCol", "pieceMoved", "pieceCaptured", "moveID",
+                 "isPawnPromotion", "isEnpassantMove", "isCastleMove", "isCapture",
+                 "isCheckMove", "isCheckmateMove", "isStalemateMove")
+
     def __init__(self, startSq, endSq, board, isEnpassantMove=False, isCastleMove=False):
-        self.startRow = startSq[0]
-        self.startCol = startSq[1]
-        self.endRow = endSq[0]
-        self.endCol = endSq[1]
+        self.startRow = startRow = startSq[0]
+        self.startCol = startCol = startSq[1]
+        self.endRow = endRow = endSq[0]
+        self.endCol = endCol = endSq[1]
 
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
-        self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
+        self.pieceMoved = pieceMoved = board[startRow][startCol]
+        self.pieceCaptured = board[endRow][endCol]
+        # start square in bits 0-5 and end square in bits 6-11, squares numbered row * 8 + col
+        # promotions are always to a queen, so the two squares identify a move within a position
+        self.moveID = startRow << 3 | startCol | endRow << 9 | endCol << 6
 
         # pawn promotion
-        self.isPawnPromotion = (self.pieceMoved == "wP" and self.endRow == 0) or \
-                               (self.pieceMoved == "bP" and self.endRow == 7)
+        self.isPawnPromotion = pieceMoved[1] == "P" and (endRow == 0 or endRow == 7)
 
         # en passant
         self.isEnpassantMove = isEnpassantMove
-        if self.isEnpassantMove:
-            self.pieceCaptured = "wP" if self.pieceMoved == "bP" else "bP"
+        if isEnpassantMove:
+            self.pieceCaptured = "wP" if pieceMoved == "bP" else "bP"
 
         # castling
         self.isCastleMove = isCastleMove
@@ -431,18 +863,53 @@ class Move:
         self.isCheckmateMove = False
         self.isStalemateMove = False
 
+    # the same move from square numbers (row * 8 + col) and the pieces involved, without reading a board
+    # the bitboard generator knows them all already
+    @classmethod
+    def FromSquares(cls, startSq, endSq, pieceMoved, pieceCaptured, isEnpassantMove=False, isCastleMove=False):
+        move = cls.__new__(cls)
+        move.startRow, move.startCol = startSq >> 3, startSq & 7
+        move.endRow, move.endCol = endSq >> 3, endSq & 7
+        move.pieceMoved = pieceMoved
+        move.pieceCaptured = ("wP" if pieceMoved == "bP" else "bP") if isEnpassantMove else pieceCaptured
+        move.moveID = startSq | endSq << 6
+        move.isPawnPromotion = pieceMoved[1] == "P" and (endSq < 8 or endSq >= 56)
+        move.isEnpassantMove = isEnpassantMove
+        move.isCastleMove = isCastleMove
+        move.isCapture = move.pieceCaptured != "--"
+        move.isCheckMove = move.isCheckmateMove = move.isStalemateMove = False
+        return move
+
     # override the equals method
     def __eq__(self, other):
         if isinstance(other, Move):
             return self.moveID == other.moveID
         return False
 
+    # equal moves hash alike, so moves can be used as set members and dictionary keys
+    def __hash__(self):
+        return self.moveID
+
+    # start and end square (row * 8 + col) of a packed moveID
+    @staticmethod
+    def UnpackID(moveID):
+        return moveID & 0x3F, moveID >> 6 & 0x3F
+
+    @staticmethod
+    def PackID(startSq, endSq):
+        return startSq[0] << 3 | startSq[1] | endSq[0] << 9 | endSq[1] << 6
+
     def GetChessNotation(self) -> str:
         return str(self)
 
     def GetRankFile(self, r, c):
         return self.colsToFiles[c] + self.rowsToRanks[r]
 
+    # start and end square like "e2e4", with a "q" after promotions - the notation UCI uses
+    def GetCoordinates(self):
+        coordinates = self.GetRankFile(self.startRow, self.startCol) + self.GetRankFile(self.endRow, self.endCol)
+        return coordinates + "q" if self.isPawnPromotion else coordinates
+
     def __str__(self, gameState=None):
         # castle move
         if self.isCastleMove:
@@ -1,24 +1,27 @@
 """
 Driver file
 Handles user input and displays current game state
+Run "python ChessMain.py --resolution 900 --black 5 --black-time 2", anything not given comes from
+chess.json next to this file (or --config), and the game type is asked for when neither sets the players
+pygame is imported when the window opens rather than with this module, the AI processes import this
+module as their __main__ on platforms that spawn them and never need it
 """
 
-from multiprocessing import Process, Queue
-
+import argparse
+import collections
+import glob
+import json
 import os
-import pygame as p
-import pygame.time
 
-import BorderedText
+import BitboardEngine
 import ChessEngine
+import EngineWorker
 import SmartMoveFinder
 
-os.system("cls")
-BOARD_WIDTH = BOARD_HEIGHT = 512
-
-if __name__ == "__main__":
-    BOARD_WIDTH = BOARD_HEIGHT = int(input("\nInput vertical resolution: "))
+p = None  # pygame and BorderedText, imported by InitDisplay
+BorderedText = None
 
+BOARD_WIDTH = BOARD_HEIGHT = 512
 TXT_MULTIPLIER = BOARD_HEIGHT / 512
 MOVE_LOG_PANEL_WIDTH = 256 * TXT_MULTIPLIER
 MOVE_LOG_PANEL_HEIGHT = BOARD_HEIGHT
@@ -27,203 +30,435 @@ SQ_SIZE = BOARD_HEIGHT // DIMENSION
 MAX_FPS = 60
 IMAGES = {}
 FONTS = []
+BOARD_SURFACES = {}  # squares and coordinates drawn once for each square size
+BOARD_RECT = MOVE_LOG_RECT = None  # set by SetResolution
+EXPOSE_EVENTS = ()  # events after which the window has to be drawn again in full, set by InitDisplay
+COLOURS = ["white", "grey", "black"]  # light squares, dark squares, coordinates
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGE_DIR = os.path.join(BASE_DIR, "images")
+SPRITES = ["wP", "wR", "wN", "wB", "wK", "wQ", "bP", "bR", "bN", "bB", "bK", "bQ", "--", "CaptureSquare"]
+CONFIG_FILE = os.path.join(BASE_DIR, "chess.json")
 
 MUSIC = 1
 
 RANKS = "87654321"
 FILES = "abcdefgh"
 
+# board backend - ChessEngine.GameState is the plain 8x8 list version
+GameState = BitboardEngine.BitboardGameState
+
+
+# sizes the board and the move log panel from the board height in pixels
+def SetResolution(height):
+    global BOARD_WIDTH, BOARD_HEIGHT, TXT_MULTIPLIER, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT, SQ_SIZE
+    global BOARD_RECT, MOVE_LOG_RECT
+    BOARD_WIDTH = BOARD_HEIGHT = height
+    TXT_MULTIPLIER = BOARD_HEIGHT / 512
+    MOVE_LOG_PANEL_WIDTH = 256 * TXT_MULTIPLIER
+    MOVE_LOG_PANEL_HEIGHT = BOARD_HEIGHT
+    SQ_SIZE = BOARD_HEIGHT // DIMENSION
+    BOARD_RECT = p.Rect(0, 0, BOARD_WIDTH, BOARD_HEIGHT)
+    MOVE_LOG_RECT = p.Rect(BOARD_WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT)
+
+
+# imports pygame, sizes everything for the resolution and opens the window
+def InitDisplay(resolution):
+    global p, BorderedText, EXPOSE_EVENTS
+    import pygame as p
+    import BorderedText
+    # pygame 1 has no WINDOWEXPOSED
+    EXPOSE_EVENTS = (p.VIDEOEXPOSE, p.ACTIVEEVENT, getattr(p, "WINDOWEXPOSED", p.VIDEOEXPOSE))
+    SetResolution(resolution)
+    p.init()
+    screen = p.display.set_mode((BOARD_WIDTH + MOVE_LOG_PANEL_WIDTH, BOARD_HEIGHT))
+    screen.fill(p.Color("white"))
+    LoadImages()
+    LoadFonts()
+    return screen
+
 
 # Creating global dict of images
+# the sprites scaled to SQ_SIZE sit side by side in one atlas image, saved next to the sources the first time
+# a square size is used, its name carries the size and the newest source's mtime so an edited sprite rebuilds it
 def LoadImages():
-    SIZE_MULTIPLIER = 1
-    pieces = ["wP", "wR", "wN", "wB", "wK", "wQ", "bP", "bR", "bN", "bB", "bK", "bQ", "--", "CaptureSquare"]
-    try:
-        for piece in pieces:
-            IMAGES[piece] = p.transform.scale(p.image.load("Chess/images/" + piece + ".png"),
-                                              (SQ_SIZE * SIZE_MULTIPLIER, SQ_SIZE * SIZE_MULTIPLIER))
-    except:
-        for piece in pieces:
-            IMAGES[piece] = p.transform.scale(p.image.load("images/" + piece + ".png"),
-                                              (SQ_SIZE * SIZE_MULTIPLIER, SQ_SIZE * SIZE_MULTIPLIER))
-
+    sources = [os.path.join(IMAGE_DIR, sprite + ".png") for sprite in SPRITES]
+    version = max(int(os.path.getmtime(source)) for source in sources)
+    atlasPath = os.path.join(IMAGE_DIR, f"atlas-{SQ_SIZE}-{version}.png")
+    if os.path.exists(atlasPath):
+        atlas = p.image.load(atlasPath).convert_alpha()
+    else:
+        atlas = p.Surface((SQ_SIZE * len(SPRITES), SQ_SIZE), p.SRCALPHA)
+        for i, source in enumerate(sources):
+            atlas.blit(p.transform.scale(p.image.load(source), (SQ_SIZE, SQ_SIZE)), (i * SQ_SIZE, 0))
+        try:
+            for stale in glob.glob(os.path.join(IMAGE_DIR, f"atlas-{SQ_SIZE}-*.png")):
+                os.remove(stale)
+            p.image.save(atlas, atlasPath)
+        except OSError:  # a read-only install still works, it just scales the sprites every launch
+            pass
+    for i, sprite in enumerate(SPRITES):
+        IMAGES[sprite] = atlas.subsurface(p.Rect(i * SQ_SIZE, 0, SQ_SIZE, SQ_SIZE))
 
 
 def LoadFonts():
     global FONTS
-    FONTS = [p.font.SysFont("Arial", round(64 * TXT_MULTIPLIER), True, False),
-             p.font.SysFont("Arial", round(24 * TXT_MULTIPLIER), True, False),
-             p.font.SysFont("Arial", round(20 * TXT_MULTIPLIER), False, False),
-             p.font.SysFont("Arial", round(20 * TXT_MULTIPLIER), False, True),
-             p.font.SysFont("Arial", round(32 * TXT_MULTIPLIER), True, False),
-             p.font.SysFont("Arial", round(16 * TXT_MULTIPLIER), True, False)]
+    FONTS = [BorderedText.GetFont("Arial", round(64 * TXT_MULTIPLIER), True, False),
+             BorderedText.GetFont("Arial", round(24 * TXT_MULTIPLIER), True, False),
+             BorderedText.GetFont("Arial", round(20 * TXT_MULTIPLIER), False, False),
+             BorderedText.GetFont("Arial", round(20 * TXT_MULTIPLIER), False, True),
+             BorderedText.GetFont("Arial", round(32 * TXT_MULTIPLIER), True, False),
+             BorderedText.GetFont("Arial", round(16 * TXT_MULTIPLIER), True, False)]
 
 
 # Main driver for code. Handles user input and updates graphics
-def Main():
+def Main(argv=None):
     global animating, screen, clock, gs
 
-    gameType = GetGameType()
+    resolution, gameType, threads = GetSettings(argv)
 
-    p.init()
-    screen = p.display.set_mode((BOARD_WIDTH + MOVE_LOG_PANEL_WIDTH, BOARD_HEIGHT))
-    clock = pygame.time.Clock()
-    screen.fill(p.Color("white"))
-    gs = ChessEngine.GameState()
+    screen = InitDisplay(resolution)
+    clock = p.time.Clock()
+    gs = GameState()
+    startFen = gs.FenString()  # the AI is sent this plus the moves played since
     validMoves = gs.GetValidMoves()
     moveMade = False  # flag variable for when a move is made
     animating = False
     gameOver = False
     player1 = gameType[0]  # If a human is playing white, this will be 0. If an AI is playing, it will be AI skill level
     player2 = gameType[1]  # Same as above but for black
+    timeLimits = gameType[2]  # seconds per move for each AI that searches with a time budget, None otherwise
 
     AIThinking = False
-    moveFinderProcess = None
+    # one AI process for the game
+    engine = EngineWorker.EngineWorker(GameState, threads) if player1 or player2 else None
     moveUndone = False
 
-    LoadImages()  # only run once
-    LoadFonts()
-
     running = True
     sqSelected = ()  # no square select, keeps track of last click of the user
     playerClicks = []  # keep track of player clicks
 
-    DrawGameState(screen, gs, validMoves, sqSelected)
+    view = BoardView()
+    animator = Animator()
+    shownFrame = None  # what the screen shows, nothing is drawn while it stays the same
+    exposed = False  # the window was uncovered or restored, so the next frame redraws and flips all of it
     ChangeMusic(0)
 
-    while running:
-        humanTurn = (gs.whiteToMove and player1 == 0) or (not gs.whiteToMove and player2 == 0)
-
-        for e in p.event.get():
-            if e.type == p.QUIT:
-                running = False
-            # mouse handler
-            elif e.type == p.MOUSEBUTTONDOWN:
-                if not gameOver and humanTurn:
-                    location = p.mouse.get_pos()  # (x, y) location of mouse
-                    mouseCol, mouseRow = location[0] // SQ_SIZE, location[1] // SQ_SIZE
-                    if sqSelected == (mouseRow, mouseCol) or mouseCol >= 8:  # clicked the same square twice
-                        sqSelected = ()  # or clicked the move log
+    try:
+        while running:
+            humanTurn = (gs.whiteToMove and player1 == 0) or (not gs.whiteToMove and player2 == 0)
+
+            for e in p.event.get():
+                if e.type == p.QUIT:
+                    running = False
+                elif e.type in EXPOSE_EVENTS:
+                    view.Invalidate()
+                    shownFrame = None
+                    exposed = True
+                # mouse handler
+                elif e.type == p.MOUSEBUTTONDOWN:
+                    if not gameOver and humanTurn:
+                        location = p.mouse.get_pos()  # (x, y) location of mouse
+                        mouseCol, mouseRow = location[0] // SQ_SIZE, location[1] // SQ_SIZE
+                        if sqSelected == (mouseRow, mouseCol) or mouseCol >= 8:  # clicked the same square twice
+                            sqSelected = ()  # or clicked the move log
+                            playerClicks = []
+                        elif sqSelected == () and gs.board[mouseRow][mouseCol] == "--":
+                            pass
+                        else:
+                            sqSelected = mouseRow, mouseCol  # append for both 1st and 2nd clicks
+                            playerClicks.append(sqSelected)
+
+                        if len(playerClicks) == 2:
+                            move = ChessEngine.Move(playerClicks[0], playerClicks[1], gs.board)
+                            for i in range(len(validMoves)):
+                                if move == validMoves[i]:
+                                    gs.MakeMove(validMoves[i])
+                                    moveMade = True
+                                    animating = True
+                                    sqSelected = ()
+                                    playerClicks = []
+                            if not moveMade:
+                                playerClicks = [sqSelected]
+                # key handler
+                elif e.type == p.KEYDOWN:
+                    if e.key == p.K_z:  # undo when 'z' is pressed
+                        gs.UndoMove()
+                        validMoves = gs.GetValidMoves()
+                        moveMade = True
+                        animating = False
+                        gameOver = False
+                        if AIThinking:
+                            engine.Cancel()
+                            AIThinking = False
+                        moveUndone = True
+                    if e.key == p.K_SPACE and AIThinking:  # space makes the AI play its best move so far
+                        engine.Stop()
+                    if e.key == p.K_ESCAPE:  # escape skips the animations
+                        animator.Skip()
+                    if e.key == p.K_r:  # reset when 'r' is pressed
+                        gs = GameState()
+                        validMoves = gs.GetValidMoves()
+                        sqSelected = ()
                         playerClicks = []
-                    elif sqSelected == () and gs.board[mouseRow][mouseCol] == "--":
-                        pass
-                    else:
-                        sqSelected = mouseRow, mouseCol  # append for both 1st and 2nd clicks
-                        playerClicks.append(sqSelected)
-
-                    if len(playerClicks) == 2:
-                        move = ChessEngine.Move(playerClicks[0], playerClicks[1], gs.board)
-                        for i in range(len(validMoves)):
-                            if move == validMoves[i]:
-                                gs.MakeMove(validMoves[i])
-                                moveMade = True
-                                animating = True
-                                sqSelected = ()
-                                playerClicks = []
-                        if not moveMade:
-                            playerClicks = [sqSelected]
-            # key handler
-            elif e.type == p.KEYDOWN:
-                if e.key == p.K_z:  # undo when 'z' is pressed
-                    gs.UndoMove()
-                    validMoves = gs.GetValidMoves()
-                    moveMade = True
-                    animating = False
-                    gameOver = False
-                    if AIThinking:
-                        moveFinderProcess.terminate()
-                        AIThinking = False
-                    moveUndone = True
-                if e.key == p.K_r:  # reset when 'r' is pressed
-                    gs = ChessEngine.GameState()
-                    validMoves = gs.GetValidMoves()
-                    sqSelected = ()
-                    playerClicks = []
-                    moveMade = False
-                    animating = False
-                    gameOver = False
-                    if AIThinking:
-                        moveFinderProcess.terminate()
+                        moveMade = False
+                        animating = False
+                        gameOver = False
                         AIThinking = False
-                    moveUndone = True
-
-        # AI move finder
-        if not gameOver and not humanTurn and not moveUndone:
-            if not AIThinking:
-                AIThinking = True
-                print("AI is thinking...")
-                skillLevel = player1 if gs.whiteToMove else player2
-
-                returnQueue = Queue()   # used to pass data between threads
-                moveFinderProcess = Process(target=SmartMoveFinder.GetMove,
-                                            args=(skillLevel, validMoves, gs, returnQueue))
-                moveFinderProcess.start()   # call SmartMoveFinder.GetMove(skillLevel, validMoves, gs)
-
-            if not moveFinderProcess.is_alive():
-                AIMove = returnQueue.get()
-                if AIMove[0] is None:
-                    AIMove = SmartMoveFinder.RandomMove(validMoves), 1
-                gs.MakeMove(AIMove[0])
-                print(f"{'White' if not gs.whiteToMove else 'Black'} AI is done thinking."
-                      f" Chose '{str(AIMove[0])}. Boards: {AIMove[1]}")
-                moveMade = True
-                animating = True
-                AIThinking = False
-
-
-        if moveMade:
-            if animating:
-                AnimateMove(gs.moveLog[-1], screen, gs.board, clock)
-            validMoves = gs.GetValidMoves()
-            gs.moveLog[-1].UpdateFromGameState(gs)
-            if gs.AmIInCheck() and not gs.checkmate:
-                DrawCheckText(screen, gs, clock)
-                ChangeMusic(1)
-            else:
-                ChangeMusic(0)
-            moveMade = False
-            animating = False
-            moveUndone = False
-
-        DrawGameState(screen, gs, validMoves, sqSelected)
-
-        if isinstance(moveFinderProcess, Process):
-            if moveFinderProcess.is_alive():
-                DrawAIThinking(screen, gs.whiteToMove)
-
-
-        if gs.checkmate:
-            gameOver = True
-            if gs.whiteToMove:
-                DrawEndGameText(screen, "Checkmate!", 64, (0, 20))
-                DrawEndGameText(screen, "Black wins", 32, (0, -40))
-            else:
-                DrawEndGameText(screen, "Checkmate!", 64, (0, 20))
-                DrawEndGameText(screen, "White wins", 32, (0, -40))
-        elif gs.stalemate:
-            gameOver = True
-            DrawEndGameText(screen, "Stalemate", 64, (0, 0))
-
-        clock.tick(MAX_FPS)
-        p.display.flip()
-
-
-# Highlight square selected and moves for the piece selected
+                        animator.Skip()
+                        if engine is not None:
+                            engine.NewGame()
+                        moveUndone = True
+
+            # AI move finder
+            if not gameOver and not humanTurn and not moveUndone:
+                if not AIThinking:
+                    AIThinking = True
+                    print("AI is thinking...")
+                    skillLevel = player1 if gs.whiteToMove else player2
+                    timeLimit = timeLimits[0] if gs.whiteToMove else timeLimits[1]
+
+                    engine.Start(skillLevel, startFen, gs.moveLog, timeLimit)
+
+                if engine.Ready():
+                    moveID, boards = engine.Result()
+                    if engine.error is not None:
+                        print(f"AI failed, playing a random move instead: {engine.error}")
+                    AIMove = next((move for move in validMoves if move.moveID == moveID), None), boards
+                    if AIMove[0] is None:
+                        AIMove = SmartMoveFinder.RandomMove(validMoves), 1
+                    gs.MakeMove(AIMove[0])
+                    print(f"{'White' if not gs.whiteToMove else 'Black'} AI is done thinking."
+                          f" Chose '{str(AIMove[0])}. Boards: {AIMove[1]}")
+                    moveMade = True
+                    animating = True
+                    AIThinking = False
+
+
+            if moveMade:
+                animator.Skip()  # whatever is still playing belongs to the position before
+                if animating:
+                    animator.Add(MoveAnimation(gs.moveLog[-1]))
+                validMoves = gs.GetValidMoves()
+                gs.moveLog[-1].UpdateFromGameState(gs)
+                if gs.AmIInCheck() and not gs.checkmate:
+                    animator.Add(CheckAnimation(gs))
+                    ChangeMusic(1)
+                else:
+                    ChangeMusic(0)
+                moveMade = False
+                animating = False
+                moveUndone = False
+
+            if gs.checkmate or gs.stalemate:
+                gameOver = True
+
+            # a running animation changes the key every frame, and the frame after it ends clears its last step away
+            frame = (gs.zobristKey, len(gs.moveLog), sqSelected, gameOver, AIThinking and engine.Info(),
+                     animator.Active(), animator.steps)
+            if frame != shownFrame:
+                dirty = view.Draw(screen, gs, validMoves, sqSelected)
+                animated = animator.Step(screen, view)
+                view.stale += animated
+                dirty += animated
+                banners = []
+                if AIThinking:
+                    banners.append(DrawAIThinking(screen, gs.whiteToMove, engine.Info()))
+
+                if gs.checkmate:
+                    banners.append(DrawEndGameText(screen, "Checkmate!", 64, (0, 20)))
+                    winner = "Black wins" if gs.whiteToMove else "White wins"
+                    banners.append(DrawEndGameText(screen, winner, 32, (0, -40)))
+                elif gs.stalemate:
+                    banners.append(DrawEndGameText(screen, "Stalemate", 64, (0, 0)))
+                view.stale += banners
+                if exposed:
+                    p.display.flip()
+                    exposed = False
+                else:
+                    p.display.update(dirty + banners)
+                shownFrame = frame
+
+            clock.tick(MAX_FPS)
+    finally:  # the worker isn't a daemon, it would keep the interpreter alive
+        if engine is not None:
+            engine.Close()
+
+
+# The board as two cached layers, so a frame only redraws the squares that changed
+# boardLayer is the squares and coordinates, piecesLayer is the same with the pieces on top and is
+# brought up to date a square at a time when a move is made or undone
+class BoardView:
+    def __init__(self):
+        self.boardLayer = GetBoardSurface()
+        self.piecesLayer = self.boardLayer.copy()
+        self.shownBoard = [["--"] * DIMENSION for _ in range(DIMENSION)]  # the pieces piecesLayer shows
+        self.highlighted = []  # highlighted squares on the screen
+        self.stale = [BOARD_RECT]  # screen rects drawn over since, put back from the layers by the next Draw
+        self.shownMoveLog = None
+
+    # starts the layers and the screen over, for when the window lost what was drawn on it
+    def Invalidate(self):
+        self.piecesLayer = self.boardLayer.copy()
+        self.shownBoard = [["--"] * DIMENSION for _ in range(DIMENSION)]
+        self.highlighted = []
+        self.stale = [BOARD_RECT]
+        self.shownMoveLog = None
+
+    # redraws the squares of piecesLayer whose piece changed and returns their rects
+    def Sync(self, board):
+        changed = []
+        for r in range(DIMENSION):
+            for c in range(DIMENSION):
+                piece = board[r][c]
+                if piece != self.shownBoard[r][c]:
+                    square = SquareRect(r, c)
+                    self.piecesLayer.blit(self.boardLayer, square, square)
+                    if piece != "--":
+                        self.piecesLayer.blit(IMAGES[piece], square)
+                    self.shownBoard[r][c] = piece
+                    changed.append(square)
+        return changed
+
+    # puts the layers back over rect, redrawing the move log when rect reaches into it
+    def Restore(self, screen, gs, rect):
+        boardPart = rect.clip(BOARD_RECT)
+        screen.blit(self.piecesLayer, boardPart, boardPart)
+        if BOARD_RECT.contains(rect):
+            return [boardPart]
+        self.shownMoveLog = None
+        return [boardPart, DrawMoveLog(screen, gs)]
+
+    # draws what changed since the last call and returns the screen rects to update
+    def Draw(self, screen, gs, validMoves, sqSelected):
+        dirty = []
+        for rect in self.Sync(gs.board) + self.highlighted + self.stale:
+            dirty += self.Restore(screen, gs, rect)
+        self.stale = []
+        self.highlighted = HighlightSquares(screen, gs, validMoves, sqSelected)
+        dirty += self.highlighted
+        moveLog = (len(gs.moveLog), str(gs.moveLog[-1]) if gs.moveLog else "")
+        if moveLog != self.shownMoveLog:
+            dirty.append(DrawMoveLog(screen, gs))
+            self.shownMoveLog = moveLog
+        return dirty
+
+
+# Plays animations one step per main loop frame, in the order they were added
+# BoardView.Draw puts back what the last step drew over before the next step draws
+class Animator:
+    def __init__(self):
+        self.queue = collections.deque()
+        self.steps = 0  # steps drawn so far
+
+    def Add(self, animation):
+        self.queue.append(animation)
+
+    # drops the running animation and everything queued after it
+    def Skip(self):
+        self.queue.clear()
+
+    def Active(self):
+        return bool(self.queue)
+
+    # draws the next step of the current animation and returns the rects drawn over
+    def Step(self, screen, view):
+        if not self.queue:
+            return []
+        animation = self.queue[0]
+        rects = animation.Step(screen, view)
+        self.steps += 1
+        if animation.Done():
+            self.queue.popleft()
+        return rects
+
+
+# Slides the moved piece from its start square to its end square over the board after the move
+class MoveAnimation:
+    def __init__(self, move, framesPerSquare=8):
+        self.move = move
+        self.frameCount = (abs(move.endRow - move.startRow) + abs(move.endCol - move.startCol)) * framesPerSquare
+        self.frame = 0
+        self.area = SquareRect(move.startRow, move.startCol).union(SquareRect(move.endRow, move.endCol))
+
+    def Step(self, screen, view):
+        move = self.move
+        r = move.startRow + (move.endRow - move.startRow) * self.frame / self.frameCount
+        c = move.startCol + (move.endCol - move.startCol) * self.frame / self.frameCount
+        endSquare = SquareRect(move.endRow, move.endCol)
+        screen.blit(view.boardLayer, endSquare, endSquare)
+        if move.pieceCaptured != "--":
+            if move.isEnpassantMove:
+                enPassantRow = (move.endRow + 1) if move.pieceCaptured[0] == "b" else move.endRow - 1
+                endSquare = SquareRect(enPassantRow, move.endCol)
+            screen.blit(IMAGES[move.pieceCaptured], endSquare)
+        # draw moving piece
+        screen.blit(IMAGES[move.pieceMoved], p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
+        self.frame += 1
+        return [self.area]
+
+    def Done(self):
+        return self.frame > self.frameCount
+
+
+# Fades "Check!" in over the king in check, holds it, then fades it out
+class CheckAnimation:
+    ALPHAS = [round(i * 7.3) for i in range(35)] + [255] * 16 + [255 - i * 17 for i in range(15)]
+
+    def __init__(self, gs):
+        kingPos = gs.whiteKingLocation if gs.whiteToMove else gs.blackKingLocation
+        drawPos = (kingPos[1] * SQ_SIZE,
+                   kingPos[0] * SQ_SIZE + SQ_SIZE * 0.5)
+        if kingPos[0] == 7:
+            drawPos = (kingPos[1] * SQ_SIZE,
+                       kingPos[0] * SQ_SIZE - SQ_SIZE * 0.5)
+
+        self.txtSurface = BorderedText.Render("Check!", FONTS[4], p.Color("red"), p.Color("black")).copy()  # faded
+        self.txtLocation = self.txtSurface.get_rect().move(drawPos[0] - self.txtSurface.get_width() / 2 + SQ_SIZE / 2,
+                                                           drawPos[1] - self.txtSurface.get_height() / 2 + SQ_SIZE / 2)
+        self.frame = 0
+
+    def Step(self, screen, view):
+        self.txtSurface.set_alpha(self.ALPHAS[self.frame])
+        self.frame += 1
+        return [screen.blit(self.txtSurface, self.txtLocation)]
+
+    def Done(self):
+        return self.frame >= len(self.ALPHAS)
+
+
+def SquareRect(r, c):
+    return p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+
+
+# Highlight square selected and moves for the piece selected, returns the highlighted squares
+# the highlights go between the board and the pieces, so those squares are drawn again from the board layer up
 def HighlightSquares(screen, gs, validMoves, sqSelected):
+    highlighted = []
     if sqSelected != ():
         r, c = sqSelected
         if gs.board[r][c][0] == ("w" if gs.whiteToMove else "b"):  # sqselected is a piece that can be moved:
+            boardLayer = GetBoardSurface()
             s = p.Surface((SQ_SIZE, SQ_SIZE))
             s.set_alpha(100)  # transparency value
             s.fill(p.Color("red"))
-            screen.blit(s, (c * SQ_SIZE, r * SQ_SIZE))
+            square = SquareRect(r, c)
+            screen.blit(boardLayer, square, square)
+            highlighted.append(screen.blit(s, square))
             # highlight moves from that square
             s.fill(p.Color("yellow"))
             for move in validMoves:
                 if move.startRow == r and move.startCol == c:
-                    screen.blit(s, (move.endCol * SQ_SIZE, move.endRow * SQ_SIZE))
+                    square = SquareRect(move.endRow, move.endCol)
+                    screen.blit(boardLayer, square, square)
+                    highlighted.append(screen.blit(s, square))
                     if move.isCapture and not move.isEnpassantMove:
-                        screen.blit(IMAGES["CaptureSquare"], (move.endCol * SQ_SIZE, move.endRow * SQ_SIZE))
+                        screen.blit(IMAGES["CaptureSquare"], square)
+            for square in highlighted:
+                piece = gs.board[square.y // SQ_SIZE][square.x // SQ_SIZE]
+                if piece != "--":
+                    screen.blit(IMAGES[piece], square)
+    return highlighted
 
 
 def ChangeMusic(music):
@@ -242,95 +477,29 @@ def ChangeMusic(music):
 
 
 
-# Responsible for all graphics in current game state
-def DrawGameState(screen, gs, validMoves, sqSelected):
-    screen.fill(p.Color("black"))
-    DrawBoard(screen)  # draw squares on the board
-    HighlightSquares(screen, gs, validMoves, sqSelected)  # highlighting of squares
-    DrawPieces(screen, gs.board)  # draw pieces on top of the squares
-    DrawMoveLog(screen, gs)
-
-
-# Draws the squares on the board
-def DrawBoard(screen):
-    global colours
-    colours = [p.Color("white"), p.Color("grey"), p.Color("black")]
-    for r in range(DIMENSION):
-        for c in range(DIMENSION):
-            color = colours[((r + c) % 2)]
-            p.draw.rect(screen, color, p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
-
-    grey = True
-    for i in range(DIMENSION):
-        txtSurface = FONTS[5].render(RANKS[i], True, colours[2])
-        textLocation = p.Rect(0, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_WIDTH)\
-            .move(0, SQ_SIZE * i)
-        screen.blit(txtSurface, textLocation)
+# The squares and coordinates of the board at the current square size, drawn the first time they're needed
+def GetBoardSurface():
+    if SQ_SIZE not in BOARD_SURFACES:
+        surface = p.Surface(BOARD_RECT.size)
+        surface.fill(p.Color("black"))
+        for r in range(DIMENSION):
+            for c in range(DIMENSION):
+                p.draw.rect(surface, COLOURS[(r + c) % 2], SquareRect(r, c))
 
-        txtSurface = FONTS[5].render(FILES[i], True, colours[2])
-        textLocation = p.Rect(0, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_WIDTH)\
-            .move(SQ_SIZE * (i+1) - txtSurface.get_width(), SQ_SIZE * DIMENSION - txtSurface.get_height())
-        screen.blit(txtSurface, textLocation)
-
-        grey = not grey
-
-# Draws the pieces on the board from the current game state
-def DrawPieces(screen, board):
-    for r in range(DIMENSION):
-        for c in range(DIMENSION):
-            piece = board[r][c]
-            if piece != "--":
-                screen.blit(IMAGES[piece], p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
-
-
-def DrawCheckText(screen, gs, clock):
-    kingPos = gs.whiteKingLocation if gs.whiteToMove else gs.blackKingLocation
-    drawPos = (kingPos[1] * SQ_SIZE,
-               kingPos[0] * SQ_SIZE + SQ_SIZE * 0.5)
-    if kingPos[0] == 7:
-        drawPos = (kingPos[1] * SQ_SIZE,
-                   kingPos[0] * SQ_SIZE - SQ_SIZE * 0.5)
-
-    txtSurface = BorderedText.Render("Check!", FONTS[4], p.Color("red"), p.Color("black"))
-    txtLocation = p.Rect(0, 0, BOARD_WIDTH, BOARD_HEIGHT)\
-        .move(drawPos[0] - txtSurface.get_width() / 2 + SQ_SIZE / 2,
-              drawPos[1] - txtSurface.get_height() / 2 + SQ_SIZE / 2)
-
-
-    for i in range(35):
-        screen.fill(p.Color("black"))
-        DrawBoard(screen)  # draw squares on the board
-        DrawPieces(screen, gs.board)  # draw pieces on top of the squares
-        DrawMoveLog(screen, gs)
-        txtSurface.set_alpha(round(i * 7.3))
-        screen.blit(txtSurface, txtLocation)
-        pygame.display.flip()
-        clock.tick(60)
-
-    screen.fill(p.Color("black"))
-    DrawBoard(screen)  # draw squares on the board
-    DrawPieces(screen, gs.board)  # draw pieces on top of the squares
-    DrawMoveLog(screen, gs)
-    txtSurface.set_alpha(255)
-    screen.blit(txtSurface, txtLocation)
-    pygame.display.flip()
-
-    for i in range(15):
-        clock.tick(60)
-
-    for i in range(15):
-        screen.fill(p.Color("black"))
-        DrawBoard(screen)  # draw squares on the board
-        DrawPieces(screen, gs.board)  # draw pieces on top of the squares
-        DrawMoveLog(screen, gs)
-        txtSurface.set_alpha(255 - i * 17)
-        screen.blit(txtSurface, txtLocation)
-        pygame.display.flip()
-        clock.tick(60)
+        for i in range(DIMENSION):
+            txtSurface = BorderedText.RenderText(RANKS[i], FONTS[5], COLOURS[2])
+            surface.blit(txtSurface, (0, SQ_SIZE * i))
 
+            txtSurface = BorderedText.RenderText(FILES[i], FONTS[5], COLOURS[2])
+            surface.blit(txtSurface, (SQ_SIZE * (i + 1) - txtSurface.get_width(),
+                                      SQ_SIZE * DIMENSION - txtSurface.get_height()))
+        BOARD_SURFACES[SQ_SIZE] = surface
+    return BOARD_SURFACES[SQ_SIZE]
 
 
+# Draws the title, the key hints and the last 12 moves into the panel right of the board, returns the panel's rect
 def DrawMoveLog(screen, gs):
+    screen.fill(p.Color("black"), MOVE_LOG_RECT)
     txtSurface = BorderedText.Render("Chess", FONTS[0], p.Color("white"), (64, 64, 64))
     textLocation = p.Rect(0, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_WIDTH)\
         .move(BOARD_WIDTH + MOVE_LOG_PANEL_WIDTH / 2 - txtSurface.get_width() / 2, 0)
@@ -341,16 +510,16 @@ def DrawMoveLog(screen, gs):
         .move(BOARD_WIDTH + MOVE_LOG_PANEL_WIDTH / 2 - txtSurface.get_width() / 2, 72 * TXT_MULTIPLIER)
     screen.blit(txtSurface, textLocation)
 
-    txtSurface = FONTS[3].render("Press 'Z' to undo", True, p.Color("white"))
+    txtSurface = BorderedText.RenderText("Press 'Z' to undo", FONTS[3], p.Color("white"))
     textLocation = p.Rect(0, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_WIDTH)\
         .move(BOARD_WIDTH + 10 * TXT_MULTIPLIER, 112 * TXT_MULTIPLIER)
     screen.blit(txtSurface, textLocation)
-    txtSurface = FONTS[3].render("Press 'R' to reset", True, p.Color("white"))
+    txtSurface = BorderedText.RenderText("Press 'R' to reset", FONTS[3], p.Color("white"))
     textLocation = p.Rect(0, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_WIDTH) \
         .move(BOARD_WIDTH + 10 * TXT_MULTIPLIER, 137 * TXT_MULTIPLIER)
     screen.blit(txtSurface, textLocation)
 
-    moveLogRect = p.Rect(BOARD_WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT)
+    moveLogRect = MOVE_LOG_RECT
 
     moveLog = gs.moveLog
     moveTexts = []
@@ -371,49 +540,33 @@ def DrawMoveLog(screen, gs):
     lineSpacing = 4 * TXT_MULTIPLIER
     for i in range(start, len(moveTexts)):
         text = moveTexts[i][0]
-        textObject = FONTS[2].render(text, True, p.Color("white"))
+        textObject = BorderedText.RenderText(text, FONTS[2], p.Color("white"))
         textLocation = moveLogRect.move(padding, textY)
         screen.blit(textObject, textLocation)
 
         text = moveTexts[i][1]
-        textObject = FONTS[2].render(text, True, p.Color("white"))
+        textObject = BorderedText.RenderText(text, FONTS[2], p.Color("white"))
         textLocation = moveLogRect.move(otherColumn, textY)
         screen.blit(textObject, textLocation)
 
         textY += textObject.get_height() + lineSpacing
+    return moveLogRect
 
 
-def DrawAIThinking(screen, whiteToMove):
-    DrawEndGameText(screen, " CPU is thinking... ", 40, offset=(0, 192 if not whiteToMove else -192),
-                    background=True, colour="blue", borderColour="white")
-    p.display.flip()
-
-
-def AnimateMove(move, screen, board, clock, framesPerSquare=8):
-    global colours
-    deltaR = move.endRow - move.startRow
-    deltaC = move.endCol - move.startCol
-    frameCount = (abs(deltaR) + abs(deltaC)) * framesPerSquare
-    for frame in range(frameCount + 1):
-        r, c = (move.startRow + deltaR * frame / frameCount, move.startCol + deltaC * frame / frameCount)
-        DrawBoard(screen)
-        DrawPieces(screen, board)
-        colour = colours[(move.endRow + move.endCol) % 2]
-        endSquare = p.Rect(move.endCol * SQ_SIZE, move.endRow * SQ_SIZE, SQ_SIZE, SQ_SIZE)
-        p.draw.rect(screen, colour, endSquare)
-        if move.pieceCaptured != "--":
-            if move.isEnpassantMove:
-                enPassantRow = (move.endRow + 1) if move.pieceCaptured[0] == "b" else move.endRow - 1
-                endSquare = p.Rect(move.endCol * SQ_SIZE, enPassantRow * SQ_SIZE, SQ_SIZE, SQ_SIZE)
-            screen.blit(IMAGES[move.pieceCaptured], endSquare)
-        # draw moving piece
-        screen.blit(IMAGES[move.pieceMoved], p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
-        p.display.flip()
-        clock.tick(60)
+# info is the search's (depth, move, score, nodes, principal variation) so far, or None
+# returns the rect drawn over
+def DrawAIThinking(screen, whiteToMove, info=None):
+    text, size = " CPU is thinking... ", 40
+    if info is not None:  # live analysis - score is from the side to move's point of view
+        depth, move, score, nodes, line = info
+        text, size = f" Depth {depth}: {' '.join(line[:4])} ({round(score * 10) / 10}) ", 28
+    return DrawEndGameText(screen, text, size, offset=(0, 192 if not whiteToMove else -192),
+                           background=True, colour="blue", borderColour="white")
 
 
+# Draws text centred on the board, returns the rect drawn over
 def DrawEndGameText(screen, text, size, offset=(0, 0), background=True, colour="white", borderColour="black"):
-    font = p.font.SysFont("Arial", round(size * TXT_MULTIPLIER), True, False)
+    font = BorderedText.GetFont("Arial", round(size * TXT_MULTIPLIER), True, False)
     txtSurface = BorderedText.Render(text, font, p.Color(colour), p.Color(borderColour))
 
     textLocation = p.Rect(0, 0, BOARD_WIDTH, BOARD_HEIGHT).move(
@@ -425,19 +578,45 @@ def DrawEndGameText(screen, text, size, offset=(0, 0), background=True, colour="
         bg.set_alpha(196)
 
         screen.blit(bg, (textLocation.x, textLocation.y))
-    screen.blit(txtSurface, textLocation)
+    return screen.blit(txtSurface, textLocation)
+
+
+# (resolution, game type) from the command line, then the config file, then the defaults
+# the game type is (white, black, (white time limit, black time limit)) like GetGameType gives
+# the config file takes the options' names as keys, like {"resolution": 900, "black": 5, "black_time": 2}
+def GetSettings(argv=None):
+    parser = argparse.ArgumentParser(description="Play chess against a person or the computer")
+    parser.add_argument("--resolution", type=int, help="board height in pixels (default 512)")
+    parser.add_argument("--white", type=int, choices=range(6), help="0 for a human, 1 to 5 for an AI skill level")
+    parser.add_argument("--black", type=int, choices=range(6), help="0 for a human, 1 to 5 for an AI skill level")
+    parser.add_argument("--white-time", type=float, help="seconds per move for a skill level 5 white AI")
+    parser.add_argument("--black-time", type=float, help="seconds per move for a skill level 5 black AI")
+    parser.add_argument("--threads", type=int,
+                        help="processes for a skill level 5 search, over 1 splits the root moves (default 1)")
+    parser.add_argument("--config", default=CONFIG_FILE, help="JSON file with any of the settings above")
+    args = parser.parse_args(argv)
+
+    config = {}
+    if os.path.exists(args.config):
+        with open(args.config) as configFile:
+            config = json.load(configFile)
+    settings = {key: value if value is not None else config.get(key) for key, value in vars(args).items()}
+
+    resolution = settings["resolution"] or BOARD_HEIGHT
+    threads = settings["threads"] or 1
+    if settings["white"] is None and settings["black"] is None:
+        return resolution, GetGameType(), threads
+    white, black = settings["white"] or 0, settings["black"] or 0
+    return resolution, (white, black, (settings["white_time"] if white == 5 else None,
+                                       settings["black_time"] if black == 5 else None)), threads
 
 
 def GetGameType():
-    # return (0, 5)
+    # return (0, 5, (None, 3))
 
     types = ["1", "2", "3"]
     type = "4"
 
-    abspath = os.path.abspath(__file__)
-    dname = os.path.dirname(abspath)
-    os.chdir(dname)
-
     while type not in types:
         os.system("cls")
         type = input('''Welcome to Chess!
@@ -451,11 +630,14 @@ Please enter game type.
 > ''')
 
     if type == "1":
-        return (0, 0)
+        return (0, 0, (None, None))
     elif type == "2":
-        return (0, GetAIType(False))
+        black = GetAIType(False)
+        return (0, black, (None, GetAITimeLimit(black, False)))
     else:
-        return (GetAIType(True), GetAIType(False))
+        white = GetAIType(True)
+        black = GetAIType(False)
+        return (white, black, (GetAITimeLimit(white, True), GetAITimeLimit(black, False)))
 
 
 def GetAIType(isWhite):
@@ -474,6 +656,19 @@ Skill level 5: NegaMax Algorithm
 > '''))
 
 
+# only skill level 5 searches with a time budget, an empty answer keeps it at a fixed depth
+def GetAITimeLimit(skillLevel, isWhite):
+    if skillLevel != 5:
+        return None
+    os.system("cls")
+    seconds = input(f'''Please enter {"white" if isWhite else "black"} AI thinking time in seconds per move.
+
+Leave blank to search to a fixed depth instead.
+
+> ''')
+    return float(seconds) if seconds.strip() != "" else None
+
+
 
 if __name__ == "__main__":
     Main()
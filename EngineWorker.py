@@ -0,0 +1,173 @@
+"""
+Long-lived AI process, started once per game
+Each request sends the starting position as a FEN plus the moves played since as packed moveIDs
+The worker only replays the moves it hasn't seen yet, so its game state, transposition table
+and search pool stay warm between moves
+While searching it streams an info message after each depth, and a shared stop signal ends the search cleanly
+workers over 1 makes skill level 5 spread its search over that many more processes
+"""
+
+import traceback
+from multiprocessing import Pipe, Process, Value
+
+import SmartMoveFinder
+
+
+class EngineWorker:
+    def __init__(self, gameStateClass, workers=1):
+        self.gameStateClass = gameStateClass
+        self.workers = workers
+        self.stopSignal = Value("i", 0)  # searches for requests up to this number stop
+        self.requestID = 0
+        self.result = None
+        self.info = None
+        self.error = None  # why the last request got no move from the search, or None
+        self.StartProcess()
+
+    # starts the worker process, and starts a new one after a worker has died
+    def StartProcess(self):
+        self.connection, workerConnection = Pipe()
+        # not a daemon, so the parallel search can start its own worker processes - Close() has to be reached
+        self.process = Process(target=RunWorker,
+                               args=(workerConnection, self.gameStateClass, self.stopSignal, self.workers))
+        self.process.start()
+        workerConnection.close()
+
+    # ask for a move in the position startFen plus the moves in moveLog - Ready() says when it has arrived
+    def Start(self, skillLevel, startFen, moveLog, timeLimit=None):
+        self.requestID += 1
+        self.result = None
+        self.info = None
+        self.error = None
+        if not self.process.is_alive():
+            self.connection.close()
+            self.StartProcess()
+        try:
+            self.connection.send(("move", self.requestID, skillLevel, startFen, [move.moveID for move in moveLog],
+                                  timeLimit))
+        except OSError:
+            self.Fail("the AI process stopped")
+
+    # finish the search early - the answer is the best move of the last finished depth
+    def Stop(self):
+        self.stopSignal.value = self.requestID
+
+    # stop the search and forget it - its answer is dropped when it comes
+    def Cancel(self):
+        self.Stop()
+        self.requestID += 1
+        self.result = None
+        self.info = None
+
+    # a worker that fails or dies answers with moveID 0 and the reason in self.error
+    def Ready(self):
+        alive = self.process.is_alive()  # checked first, anything sent before it died is still read
+        try:
+            while self.result is None and self.connection.poll():
+                message = self.connection.recv()
+                if message[1] != self.requestID:  # messages about cancelled requests are dropped
+                    continue
+                if message[0] == "info":
+                    self.info = message[2:]
+                elif message[0] == "error":
+                    self.Fail(message[2])
+                else:
+                    self.result = message
+        except (EOFError, OSError):
+            alive = False
+        if self.result is None and not alive:
+            self.Fail(f"the AI process stopped with exit code {self.process.exitcode}")
+        return self.result is not None
+
+    # answers the current request with no move
+    def Fail(self, error):
+        self.error = error
+        self.result = ("move", self.requestID, 0, 0)
+
+    # (depth, move, score, nodes, principal variation) of the last finished depth, or None before the first
+    # call Ready() first to pick up new messages
+    def Info(self):
+        return self.info
+
+    # (moveID, boards scored) of the last request, moveID is 0 when there was no move
+    def Result(self):
+        _, _, moveID, boards = self.result
+        self.result = None
+        return moveID, boards
+
+    # clear the search tables, for a new game - a worker that has died is replaced, its tables start empty
+    def NewGame(self):
+        self.Cancel()
+        try:
+            if self.process.is_alive():
+                self.connection.send(("new game",))
+                return
+        except OSError:  # it died after the check
+            pass
+        self.connection.close()
+        self.StartProcess()
+
+    # stop the worker - one that still hasn't stopped after timeout seconds is killed
+    def Close(self, timeout=1):
+        self.Cancel()
+        try:
+            self.connection.send(("quit",))
+        except OSError:  # the worker has already gone
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.connection.close()
+
+
+# the worker process: answers requests one at a time until told to quit
+def RunWorker(connection, gameStateClass, stopSignal, workers=1):
+    gs = None
+    startFen = None
+    played = []  # moveIDs replayed on gs since startFen
+    while True:
+        message = connection.recv()
+        if message[0] == "quit":
+            break
+        if message[0] == "new game":
+            SmartMoveFinder.GetTranspositionTable().Clear()
+            SmartMoveFinder.ClearOrderingTables()
+            continue
+
+        _, requestID, skillLevel, fen, moveIDs, timeLimit = message
+        try:
+            if gs is None or fen != startFen:
+                gs = gameStateClass()
+                if gs.FenString() != fen:
+                    gs.FenString(fen)
+                startFen = fen
+                played = []
+            # undo back to the last move both histories share, then play the new ones
+            shared = 0
+            while shared < len(played) and shared < len(moveIDs) and played[shared] == moveIDs[shared]:
+                shared += 1
+            for _ in range(len(played) - shared):
+                gs.UndoMove()
+            del played[shared:]
+            for moveID in moveIDs[shared:]:
+                move = gs.GetLegalMoveByID(moveID)
+                if move is None:
+                    raise ValueError(f"illegal move {moveID} in the game history")
+                gs.MakeMove(move)
+                played.append(moveID)
+
+            def SendInfo(depth, bestMove, score, nodes, line):
+                connection.send(("info", requestID, depth, str(bestMove), score, nodes,
+                                 [str(move) for move in line]))
+
+            SmartMoveFinder.SetSearchControl(stopSignal, requestID, SendInfo)
+            move, boards = SmartMoveFinder.FindMove(skillLevel, gs.GetValidMoves(), gs, timeLimit, workers=workers)
+            connection.send(("move", requestID, move.moveID if move is not None else 0, boards))
+        except Exception:
+            # the worker carries on, with its game state rebuilt from the next request
+            connection.send(("error", requestID, traceback.format_exc().strip().splitlines()[-1]))
+            gs = None
+        finally:
+            SmartMoveFinder.SetSearchControl()
+    SmartMoveFinder.ShutdownSearchPool()
+    connection.close()
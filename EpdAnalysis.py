@@ -0,0 +1,170 @@
+"""
+Batch analysis of the positions in an EPD file
+Lines are read one at a time and searched across a process pool with a time or depth budget per position,
+and each result is written out as soon as it and every line before it are done, so any file size streams through
+Results are the input line with the analysis operations added: acd depth, acn nodes, acs seconds,
+ce score in centipawns for the side to move, dm when it is a forced mate, pm the move and pv the line
+Lines with bm (best moves) or am (moves to avoid) count towards a solved total, for test suites
+Run "python EpdAnalysis.py suite.epd --time 1 --output results.epd"
+"""
+
+import argparse
+import collections
+import contextlib
+import os
+import random
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import BitboardEngine
+import OpeningBook
+import SmartMoveFinder
+
+OPERATION_PATTERN = re.compile(r'\s*([A-Za-z]\w*)\s*((?:"[^"]*"|[^;"])*);')
+ANALYSIS_OPCODES = ("acd", "acn", "acs", "ce", "dm", "pm", "pv")
+
+
+# (FEN, [(opcode, operand), ...]) of an EPD line - the move counters come from hmvc and fmvn when it has them
+def ParseEpd(line):
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError(f"not an EPD line: {line}")
+    operations = OPERATION_PATTERN.findall(fields[4]) if len(fields) > 4 else []
+    values = dict(operations)
+    fen = " ".join(fields[:4] + [values.get("hmvc", "0"), values.get("fmvn", "1")])
+    return fen, [(opcode, operand.strip()) for opcode, operand in operations]
+
+
+def EpdString(fen, operations):
+    return " ".join(fen.split()[:4] + [f"{opcode} {operand};" if operand else f"{opcode};"
+                                       for opcode, operand in operations])
+
+
+# the move in standard algebraic notation, like "Nbd7", "exd5=Q+" or "O-O"
+def San(gs, move, validMoves):
+    if move.isCastleMove:
+        san = "O-O" if move.endCol == 6 else "O-O-O"
+    else:
+        endSquare = move.GetRankFile(move.endRow, move.endCol)
+        pieceType = move.pieceMoved[1]
+        if pieceType == "P":
+            san = (move.colsToFiles[move.startCol] + "x" if move.isCapture else "") + endSquare
+            if move.isPawnPromotion:
+                san += "=Q"
+        else:
+            # the same kind of piece reaching the same square needs the start file, rank, or both, to tell apart
+            rivals = [other for other in validMoves if other.pieceMoved == move.pieceMoved and other != move and
+                      (other.endRow, other.endCol) == (move.endRow, move.endCol)]
+            start = ""
+            if rivals:
+                if all(other.startCol != move.startCol for other in rivals):
+                    start = move.colsToFiles[move.startCol]
+                elif all(other.startRow != move.startRow for other in rivals):
+                    start = move.rowsToRanks[move.startRow]
+                else:
+                    start = move.GetRankFile(move.startRow, move.startCol)
+            san = pieceType + start + ("x" if move.isCapture else "") + endSquare
+    gs.MakeMove(move)
+    if gs.InCheck():
+        san += "#" if not gs.GetValidMoves() else "+"
+    gs.UndoMove()
+    return san
+
+
+# searches one EPD line in a worker process and returns (result line, solved)
+# solved is None when the line has no bm or am to check against
+def AnalysePosition(line, timeLimit, maxDepth):
+    try:
+        fen, operations = ParseEpd(line)
+        gs = BitboardEngine.BitboardGameState()
+        gs.FenString(fen)
+    except (ValueError, KeyError, IndexError) as e:
+        return f'{line} c9 "error: {e}";', None
+    # an empty table and a fixed shuffle, so a result doesn't depend on what the worker searched before
+    random.seed(fen)
+    SmartMoveFinder.GetTranspositionTable().Clear()
+    SmartMoveFinder.ClearOrderingTables()
+    SmartMoveFinder.counter = 0
+    validMoves = gs.GetValidMoves()
+    finished = []
+    SmartMoveFinder.SetSearchControl(callback=lambda *info: finished.append(info))
+    start = time.perf_counter()
+    move = SmartMoveFinder.FindBestMoveIterativeDeepening(gs, list(validMoves), timeLimit, None, maxDepth) \
+        if validMoves else None
+    elapsed = time.perf_counter() - start
+    SmartMoveFinder.SetSearchControl()
+
+    results = [(opcode, operand) for opcode, operand in operations if opcode not in ANALYSIS_OPCODES]
+    if move is not None:
+        depth, _, score, nodes, pv = finished[-1]
+        results += [("acd", str(depth)), ("acn", str(nodes)), ("acs", str(round(elapsed, 2)))]
+        results.append(("ce", str(round(score * 100))))
+        mateIn = SmartMoveFinder.MateIn(score)
+        if mateIn is not None and mateIn > 0:
+            results.append(("dm", str(mateIn)))
+        sanLine = []
+        for lineMove in pv:
+            sanLine.append(San(gs, lineMove, gs.GetValidMoves()))
+            gs.MakeMove(lineMove)
+        for _ in pv:
+            gs.UndoMove()
+        results += [("pm", San(gs, move, validMoves)), ("pv", " ".join(sanLine))]
+
+    solved = None
+    values = dict(operations)
+    if "bm" in values or "am" in values:
+        best = [OpeningBook.ParseSan(gs, san, validMoves) for san in values.get("bm", "").split()]
+        avoid = [OpeningBook.ParseSan(gs, san, validMoves) for san in values.get("am", "").split()]
+        solved = move is not None and (not best or move in best) and move not in avoid
+    return EpdString(fen, results), solved
+
+
+# results of the lines in order, with at most workers * 2 positions read ahead of the one being written
+def AnalyseLines(lines, timeLimit=None, maxDepth=None, workers=None):
+    workers = workers or os.cpu_count() or 1
+    pending = collections.deque()
+    with ProcessPoolExecutor(workers) as pool:
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            pending.append(pool.submit(AnalysePosition, line, timeLimit, maxDepth))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def Main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse every position in an EPD file")
+    parser.add_argument("epd", help="EPD file to read, - for standard input")
+    parser.add_argument("--time", type=float, help="seconds per position (default 1 when --depth isn't given)")
+    parser.add_argument("--depth", type=int, help="depth per position")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--output", default="-", help="file for the results, - for standard output")
+    args = parser.parse_args(argv)
+    timeLimit = args.time if args.time is not None or args.depth is not None else 1.0
+
+    solved = tested = positions = 0
+    start = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        epdFile = sys.stdin if args.epd == "-" else stack.enter_context(open(args.epd))
+        output = sys.stdout if args.output == "-" else stack.enter_context(open(args.output, "w"))
+        for result, isSolved in AnalyseLines(epdFile, timeLimit, args.depth, args.workers):
+            output.write(result + "\n")
+            output.flush()
+            positions += 1
+            if isSolved is not None:
+                tested += 1
+                solved += isSolved
+    summary = f"{positions} positions in {time.perf_counter() - start:.1f}s"
+    if tested:
+        summary += f", solved {solved} of {tested}"
+    print(summary, file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(Main())
@@ -0,0 +1,75 @@
+"""
+Piece values and piece-square tables for scoring a position
+Kept apart from the search so GameState can keep its running board score without importing the AI
+"""
+
+pieceScore = {"K": 0, "Q": 10, "R": 5, "B": 3, "N": 3, "P": 1}
+
+knightScores = [[1, 1, 1, 1, 1, 1, 1, 1],
+                [1, 2, 2, 2, 2, 2, 2, 1],
+                [1, 2, 3, 3, 3, 3, 2, 1],
+                [1, 2, 3, 4, 4, 3, 2, 1],
+                [1, 2, 3, 4, 4, 3, 2, 1],
+                [1, 2, 3, 3, 3, 3, 2, 1],
+                [1, 2, 2, 2, 2, 2, 2, 1],
+                [1, 1, 1, 1, 1, 1, 1, 1]]
+
+bishopScores = [[4, 3, 2, 1, 1, 2, 3, 4],
+                [3, 4, 3, 2, 2, 3, 4, 3],
+                [2, 3, 4, 3, 3, 4, 3, 2],
+                [1, 2, 3, 4, 4, 3, 2, 1],
+                [1, 2, 3, 4, 4, 3, 2, 1],
+                [2, 3, 4, 3, 3, 4, 3, 2],
+                [3, 4, 3, 2, 2, 3, 4, 3],
+                [4, 3, 2, 1, 1, 2, 3, 4]]
+
+queenScores = [[1, 1, 1, 3, 1, 1, 1, 1],
+               [1, 2, 3, 3, 3, 1, 1, 1],
+               [1, 4, 3, 3, 3, 4, 2, 1],
+               [1, 2, 3, 3, 3, 2, 2, 1],
+               [1, 2, 3, 3, 3, 2, 2, 1],
+               [1, 4, 3, 3, 3, 4, 2, 1],
+               [1, 2, 3, 3, 3, 1, 1, 1],
+               [1, 1, 1, 3, 1, 1, 1, 1]]
+
+rookScores = [[4, 3, 4, 4, 4, 4, 3, 4],
+              [4, 4, 4, 4, 4, 4, 4, 4],
+              [1, 1, 2, 3, 3, 2, 1, 1],
+              [1, 2, 3, 4, 4, 3, 2, 1],
+              [1, 2, 3, 4, 4, 3, 2, 1],
+              [1, 1, 2, 3, 3, 2, 1, 1],
+              [4, 4, 4, 4, 4, 4, 4, 4],
+              [4, 3, 4, 4, 4, 4, 3, 4]]
+
+whitePawnScores = [[9, 9, 10, 12, 12, 10, 9, 9],
+                   [7, 7, 8, 8, 8, 8, 7, 7],
+                   [5, 6, 6, 7, 7, 6, 6, 5],
+                   [2, 3, 3, 5, 5, 3, 3, 2],
+                   [1, 2, 3, 4, 4, 3, 2, 1],
+                   [1, 1, 2, 3, 3, 2, 1, 1],
+                   [1, 1, 1, 0, 0, 1, 1, 1],
+                   [0, 0, 0, 0, 0, 0, 0, 0]]
+
+kingScores = [[-4, 0, 0, 0, 0, 0, 0, -4],
+              [0 for i in range(8)],
+              [0 for i in range(8)],
+              [0 for i in range(8)],
+              [0 for i in range(8)],
+              [0 for i in range(8)],
+              [0 for i in range(8)],
+              [-4, 0, 0, 0, 0, 0, 0, -4]]
+
+blackPawnScores = whitePawnScores[0:]
+blackPawnScores.reverse()
+
+piecePositionScores = {"N": knightScores, "B": bishopScores, "Q": queenScores, "K": kingScores,
+                       "R": rookScores, "wP": whitePawnScores, "bP": blackPawnScores}
+
+# the tables above flattened into one 64-entry list per piece, indexed row * 8 + col
+# each entry is material plus position in tenths of a pawn, negative for black, so a board's score is their sum
+pieceSquareScores = {}
+for colour, sign in (("w", 1), ("b", -1)):
+    for pieceType in pieceScore:
+        positionScores = piecePositionScores[colour + "P" if pieceType == "P" else pieceType]
+        pieceSquareScores[colour + pieceType] = [sign * (pieceScore[pieceType] * 10 + positionScores[r][c])
+                                                 for r in range(8) for c in range(8)]
@@ -0,0 +1,139 @@
+"""
+Perft - counts the leaf nodes of the move tree to a fixed depth
+Used to prove move generation correct against known node counts and to measure its speed
+Run "python Perft.py" for the bundled suite, or "python Perft.py --fen <fen> --depth 4 --divide" for one position
+The engine only ever promotes to a queen, so counts for positions with promotions are queen-promotion-only counts
+"""
+
+import argparse
+import sys
+import time
+
+import BitboardEngine
+import ChessEngine
+
+# (name, fen, node counts for depth 1, 2, 3...)
+SUITE = [
+    ("start position", ChessEngine.START_FEN, (20, 400, 8902, 197281)),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", (48, 2039, 97862)),
+    ("rook endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", (14, 191, 2812, 43238)),
+    ("middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", (46, 2079, 89890)),
+    ("en passant discovers check", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1", (18, 92, 1670, 10138)),
+    ("en passant after check", "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1", (13, 102, 1266, 10276)),
+    ("en passant pinned on diagonal", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1", (15, 126, 1928, 13931)),
+    ("short castle gives check", "5k2/8/8/8/8/8/8/4K2R w K - 0 1", (15, 66, 1198, 6399)),
+    ("long castle gives check", "3k4/8/8/8/8/8/8/R3K3 w Q - 0 1", (16, 71, 1286, 7418)),
+    ("castling rights", "r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1", (26, 1141, 27826)),
+    ("castling prevented", "r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1", (44, 1494, 50509)),
+    ("checkmate and stalemate", "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1", (37, 183, 6559, 23527)),
+    ("self stalemate", "K1k5/8/P7/8/8/8/8/8 w - - 0 1", (2, 6, 13, 63)),
+    ("discovered check", "8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1", (29, 165, 5160)),
+    # queen promotions only
+    ("promotions", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", (6, 228, 8087)),
+    ("promotion and castling", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", (41, 1373, 54007)),
+    ("promote out of check", "2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1", (5, 75, 694, 9674)),
+    ("promote to give check", "4k3/1P6/8/8/8/8/K7/8 w - - 0 1", (6, 28, 248, 1379)),
+    ("promotion next to kings", "8/P1k5/K7/8/8/8/8/8 w - - 0 1", (3, 13, 111, 553)),
+]
+
+BACKENDS = {"list": ChessEngine.GameState, "bitboard": BitboardEngine.BitboardGameState}
+
+
+class PerftMismatch(Exception):
+    pass
+
+
+# number of leaf nodes depth plies below the current position
+def Perft(gs, depth):
+    moves = gs.GetValidMoves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        gs.MakeMove(move)
+        nodes += Perft(gs, depth - 1)
+        gs.UndoMove()
+    return nodes
+
+
+# perft split by root move, as a list of (move in coordinate notation, nodes)
+def Divide(gs, depth):
+    counts = []
+    for move in gs.GetValidMoves():
+        gs.MakeMove(move)
+        nodes = Perft(gs, depth - 1)
+        gs.UndoMove()
+        counts.append((move.GetCoordinates(), nodes))
+    return counts
+
+
+def NewGameState(backend, makeUndo):
+    gs = BACKENDS[backend]()
+    gs.pinAwareMoveGeneration = not makeUndo
+    return gs
+
+
+# runs every suite position up to maxDepth, prints nodes and nodes/second, raises PerftMismatch on a wrong count
+def RunSuite(backend="bitboard", maxDepth=3, makeUndo=False):
+    totalNodes = 0
+    totalTime = 0
+    failures = []
+    for name, fen, counts in SUITE:
+        for depth, expected in enumerate(counts[:maxDepth], 1):
+            gs = NewGameState(backend, makeUndo)
+            gs.FenString(fen)
+            start = time.perf_counter()
+            nodes = Perft(gs, depth)
+            elapsed = time.perf_counter() - start
+            totalNodes += nodes
+            totalTime += elapsed
+            status = "ok" if nodes == expected else f"FAIL expected {expected}"
+            print(f"{name:30} depth {depth}  {nodes:>9} nodes  {ChessEngine.NodesPerSecond(nodes, elapsed):>9} nps  {status}")
+            if nodes != expected:
+                failures.append(f"{name} depth {depth}: got {nodes}, expected {expected} ({fen})")
+    print(f"total {totalNodes} nodes in {totalTime:.2f}s, {ChessEngine.NodesPerSecond(totalNodes, totalTime)} nps")
+    if failures:
+        raise PerftMismatch("perft mismatch:\n" + "\n".join(failures))
+    return totalNodes, totalTime
+
+
+def Main(argv=None):
+    parser = argparse.ArgumentParser(description="Count move generation leaf nodes and check them against known counts")
+    parser.add_argument("--fen", help="position to count, runs the bundled suite when left out")
+    parser.add_argument("--depth", type=int, help="depth for --fen (default 4), deepest suite depth (default 3)")
+    parser.add_argument("--divide", action="store_true", help="break the --fen count down per root move")
+    parser.add_argument("--expect", type=int, help="node count --fen must produce")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="bitboard")
+    parser.add_argument("--make-undo", action="store_true",
+                        help="use the make/undo legality filter instead of the pin-aware generator")
+    args = parser.parse_args(argv)
+
+    if args.fen is None:
+        try:
+            RunSuite(args.backend, args.depth or 3, args.make_undo)
+        except PerftMismatch as e:
+            print(e, file=sys.stderr)
+            return 1
+        return 0
+
+    depth = args.depth or 4
+    gs = NewGameState(args.backend, args.make_undo)
+    gs.FenString(args.fen)
+    start = time.perf_counter()
+    if args.divide:
+        counts = Divide(gs, depth)
+        for name, nodes in counts:
+            print(f"{name}: {nodes}")
+        nodes = sum(n for _, n in counts)
+    else:
+        nodes = Perft(gs, depth)
+    elapsed = time.perf_counter() - start
+    print(f"depth {depth}: {nodes} nodes in {elapsed:.2f}s, {ChessEngine.NodesPerSecond(nodes, elapsed)} nps")
+    if args.expect is not None and nodes != args.expect:
+        print(f"perft mismatch: got {nodes}, expected {args.expect}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(Main())
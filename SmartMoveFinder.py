@@ -1,88 +1,93 @@
+import atexit
+import multiprocessing
+import os
 import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 
-pieceScore = {"K": 0, "Q": 10, "R": 5, "B": 3, "N": 3, "P": 1}
-
-knightScores = [[1, 1, 1, 1, 1, 1, 1, 1],
-                [1, 2, 2, 2, 2, 2, 2, 1],
-                [1, 2, 3, 3, 3, 3, 2, 1],
-                [1, 2, 3, 4, 4, 3, 2, 1],
-                [1, 2, 3, 4, 4, 3, 2, 1],
-                [1, 2, 3, 3, 3, 3, 2, 1],
-                [1, 2, 2, 2, 2, 2, 2, 1],
-                [1, 1, 1, 1, 1, 1, 1, 1]]
-
-bishopScores = [[4, 3, 2, 1, 1, 2, 3, 4],
-                [3, 4, 3, 2, 2, 3, 4, 3],
-                [2, 3, 4, 3, 3, 4, 3, 2],
-                [1, 2, 3, 4, 4, 3, 2, 1],
-                [1, 2, 3, 4, 4, 3, 2, 1],
-                [2, 3, 4, 3, 3, 4, 3, 2],
-                [3, 4, 3, 2, 2, 3, 4, 3],
-                [4, 3, 2, 1, 1, 2, 3, 4]]
-
-queenScores = [[1, 1, 1, 3, 1, 1, 1, 1],
-               [1, 2, 3, 3, 3, 1, 1, 1],
-               [1, 4, 3, 3, 3, 4, 2, 1],
-               [1, 2, 3, 3, 3, 2, 2, 1],
-               [1, 2, 3, 3, 3, 2, 2, 1],
-               [1, 4, 3, 3, 3, 4, 2, 1],
-               [1, 2, 3, 3, 3, 1, 1, 1],
-               [1, 1, 1, 3, 1, 1, 1, 1]]
-
-rookScores = [[4, 3, 4, 4, 4, 4, 3, 4],
-              [4, 4, 4, 4, 4, 4, 4, 4],
-              [1, 1, 2, 3, 3, 2, 1, 1],
-              [1, 2, 3, 4, 4, 3, 2, 1],
-              [1, 2, 3, 4, 4, 3, 2, 1],
-              [1, 1, 2, 3, 3, 2, 1, 1],
-              [4, 4, 4, 4, 4, 4, 4, 4],
-              [4, 3, 4, 4, 4, 4, 3, 4]]
-
-whitePawnScores = [[9, 9, 10, 12, 12, 10, 9, 9],
-                   [7, 7, 8, 8, 8, 8, 7, 7],
-                   [5, 6, 6, 7, 7, 6, 6, 5],
-                   [2, 3, 3, 5, 5, 3, 3, 2],
-                   [1, 2, 3, 4, 4, 3, 2, 1],
-                   [1, 1, 2, 3, 3, 2, 1, 1],
-                   [1, 1, 1, 0, 0, 1, 1, 1],
-                   [0, 0, 0, 0, 0, 0, 0, 0]]
-
-kingScores = [[-4, 0, 0, 0, 0, 0, 0, -4],
-              [0 for i in range(8)],
-              [0 for i in range(8)],
-              [0 for i in range(8)],
-              [0 for i in range(8)],
-              [0 for i in range(8)],
-              [0 for i in range(8)],
-              [-4, 0, 0, 0, 0, 0, 0, -4]]
-
-blackPawnScores = whitePawnScores[0:]
-blackPawnScores.reverse()
-
-piecePositionScores = {"N": knightScores, "B": bishopScores, "Q": queenScores, "K": kingScores,
-                       "R": rookScores, "wP": whitePawnScores, "bP": blackPawnScores}
+import OpeningBook
+import Tablebase
+import TranspositionTable
+from Evaluation import pieceScore
 
 CHECKMATE = 1000
 STALEMATE = 0
 DEPTH_MINMAX = 2
 DEPTH_NEGAMAX = 2
-
-
-def GetMove(skillLevel, validMoves, gs, returnQueue):
+TT_SIZE_MB = 16  # memory budget for the transposition table
+MAX_DEPTH = 64  # iterative deepening never goes deeper than this, even with time left
+NODE_CHECK_INTERVAL = 256  # how many nodes are searched between looks at the clock
+DELTA_MARGIN = 2  # quiescence skips captures that can't get within this much of alpha even winning the piece
+MATE_THRESHOLD = CHECKMATE - 2 * MAX_DEPTH  # being mated scores ply - CHECKMATE, so anything past this is a mate
+TABLEBASE_WIN = CHECKMATE / 2  # a tablebase win scores this less the plies to mate, below any mate the search sees
+SEARCH_WORKERS = os.cpu_count() or 1  # processes for a parallel root search that isn't given a worker count
+BOOK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin")  # Polyglot book, used if it exists
+BOOK_SELECTION = OpeningBook.WEIGHTED
+
+transpositionTable = None
+rootDepth = DEPTH_NEGAMAX  # depth of the current iteration, so the search knows when it is at the root
+searchNodes = 0
+searchDeadline = None  # time.perf_counter() value to stop at, or None for no time limit
+searchNodeLimit = None  # nodes to stop at, or None for no node limit
+stopSignal = None  # shared multiprocessing.Value another process sets to stop the search
+stopID = 0  # the search stops once stopSignal.value reaches this
+searchStopSignal = None  # stopSignal while it is being obeyed - like the budget, not during depth 1
+infoCallback = None  # called with (depth, move, score, nodes, principal variation) after each finished depth
+openingBook = None  # the open book, False once BOOK_FILE turned out not to exist
+
+# move ordering tables
+captureOrderScore = {"P": 1, "N": 3, "B": 3, "R": 5, "Q": 10, "K": 20}  # K only ever appears as an attacker
+killerMoves = [[0, 0] for _ in range(MAX_DEPTH + 1)]  # two quiet moveIDs per ply that recently caused cutoffs
+historyScores = {}  # moveID -> how much that quiet move has caused cutoffs, weighted by depth
+cutoffs = 0
+firstMoveCutoffs = 0
+
+# parallel root search
+searchPool = None
+searchPoolSettings = None  # (workers, deterministic) the pool was started with
+sharedAlpha = None  # best root score so far, shared by every worker
+sharedTable = None  # shared memory block holding the workers' transposition table
+
+
+# raised from inside the search when the time or node budget runs out
+class SearchStopped(Exception):
+    pass
+
+
+# timeLimit (seconds) and nodeLimit budget skill level 5 - with neither it searches to DEPTH_NEGAMAX
+# skill level 5 searches in this process unless workers over 1 asks for the parallel search,
+# and a seed makes that search reproducible
+def GetMove(skillLevel, validMoves, gs, returnQueue, timeLimit=None, nodeLimit=None, workers=None, seed=None):
+    returnQueue.put(FindMove(skillLevel, validMoves, gs, timeLimit, nodeLimit, workers, seed))
+
+
+# returns (move, boards scored) for the skill level
+def FindMove(skillLevel, validMoves, gs, timeLimit=None, nodeLimit=None, workers=None, seed=None):
     global counter
     counter = 0
-    m = None
+    knownMove = KnownMove(skillLevel, gs, validMoves)
+    if knownMove is not None:
+        return knownMove, counter
+    move = SearchMove(skillLevel, validMoves, gs, timeLimit, nodeLimit, workers, seed)
+    return move, counter
+
+
+# the move the skill level's own algorithm picks, without looking in the book or the tablebases
+def SearchMove(skillLevel, validMoves, gs, timeLimit=None, nodeLimit=None, workers=None, seed=None):
     if skillLevel == 1:  # 1: Random
-        m = RandomMove(validMoves), counter
+        return RandomMove(validMoves)
     elif skillLevel == 2:  # 2: Aggressive
-        m = AggressiveRandom(validMoves), counter
+        return AggressiveRandom(validMoves)
     elif skillLevel == 3:  # 3: Greedy Algorithm
-        m = GreedyAlgorithm(gs, validMoves), counter
+        return GreedyAlgorithm(gs, validMoves)
     elif skillLevel == 4:  # 4: MinMax Algorithm
-        m = FindBestMoveMinMax(gs, validMoves), counter
+        return FindBestMoveMinMax(gs, validMoves)
     elif skillLevel == 5:  # 6: NegaMax Algorithm with Alpha Beta Pruning
-        m = FindBestMoveNegaMaxAlphaBeta(gs, validMoves), counter
-    returnQueue.put(m)
+        if workers is not None and workers > 1 and nodeLimit is None:
+            return FindBestMoveParallel(gs, validMoves, timeLimit, workers=workers, seed=seed)
+        return FindBestMoveIterativeDeepening(gs, validMoves, timeLimit, nodeLimit)
+    raise ValueError(f"no skill level {skillLevel}, they run from 1 to 5")
 
 
 def GreedyAlgorithm(gs, validMoves):
@@ -187,37 +192,522 @@ def FindMoveNegaMax(gs, validMoves, depth, turnMultiplier):
 
 
 def FindBestMoveNegaMaxAlphaBeta(gs, validMoves):
-    global nextMove
+    global nextMove, rootDepth, searchDeadline, searchNodeLimit
     nextMove = None
     random.shuffle(validMoves)
+    GetTranspositionTable().NewSearch()
+    ClearOrderingTables()
+    rootDepth = DEPTH_NEGAMAX
+    searchDeadline = searchNodeLimit = None
     FindMoveNegaMaxAlphaBeta(gs, validMoves, DEPTH_NEGAMAX, -CHECKMATE, CHECKMATE, 1 if gs.whiteToMove else -1)
     return nextMove
 
 
+# Searches depth 1, 2, 3, ... until the budget runs out and returns the best move of the last finished depth
+def FindBestMoveIterativeDeepening(gs, validMoves, timeLimit=None, nodeLimit=None, maxDepth=None):
+    global nextMove, rootDepth, searchNodes, searchDeadline, searchNodeLimit, searchStopSignal
+    if maxDepth is None:
+        maxDepth = DEPTH_NEGAMAX if timeLimit is None and nodeLimit is None else MAX_DEPTH
+    random.shuffle(validMoves)
+    GetTranspositionTable().NewSearch()
+    ClearOrderingTables()
+    startTime = time.perf_counter()
+    moveLogLength = len(gs.moveLog)
+    searchNodes = 0
+    searchDeadline = searchNodeLimit = None  # depth 1 always finishes so there is a move to play
+    bestMove = None
+    for depth in range(1, maxDepth + 1):
+        rootDepth = depth
+        searchStopSignal = stopSignal if depth > 1 else None
+        nextMove = None
+        try:
+            score = FindMoveNegaMaxAlphaBeta(gs, validMoves, depth, -CHECKMATE, CHECKMATE,
+                                             1 if gs.whiteToMove else -1)
+        except SearchStopped:
+            while len(gs.moveLog) > moveLogLength:  # unwind the moves the search was in the middle of
+                gs.UndoMove()
+            break
+        bestMove = nextMove
+        if bestMove is None:  # no moves
+            break
+        if infoCallback is not None:
+            infoCallback(depth, bestMove, score, searchNodes, PrincipalVariation(gs, bestMove, depth))
+        if abs(score) >= MATE_THRESHOLD or StopRequested():  # a forced mate was found, or told to stop
+            break
+        # the next iteration tries this variation first, through the hash moves stored along it
+        if timeLimit is not None:
+            searchDeadline = startTime + timeLimit
+            if time.perf_counter() >= searchDeadline:
+                break
+        if nodeLimit is not None:
+            searchNodeLimit = nodeLimit
+            if searchNodes >= nodeLimit:
+                break
+    searchDeadline = searchNodeLimit = searchStopSignal = None
+    return bestMove
+
+
+# Root-splitting parallel search over a process pool, deepening one depth at a time like the search above
+# The first root move is searched alone, then the rest are spread over the workers, each searching against
+# the best score so far through sharedAlpha and sharing one transposition table
+# With a seed, each move is searched from an empty private table against the first move's score only,
+# so the result doesn't depend on which worker gets which move - reproducible as long as there's no time limit
+# A move that fails low only gives an upper bound, so the next depth orders moves by the last exact score
+# each one had, with the best move first
+def FindBestMoveParallel(gs, validMoves, timeLimit=None, maxDepth=None, workers=None, seed=None):
+    global counter
+    if maxDepth is None:
+        maxDepth = DEPTH_NEGAMAX if timeLimit is None else MAX_DEPTH
+    deterministic = seed is not None
+    if deterministic:
+        random.Random(seed).shuffle(validMoves)
+    else:
+        random.shuffle(validMoves)
+    pool = GetSearchPool(workers or SEARCH_WORKERS, deterministic, stopSignal)
+    startTime = time.perf_counter()
+    deadline = None  # time.time() value, comparable between processes - depth 1 always finishes
+    rootMoves = list(validMoves)
+    exactScores = {}  # moveID: score from the last depth that searched the move with a window it didn't fail
+    counter = 0
+    bestMove = None
+    for depth in range(1, maxDepth + 1):
+        if not rootMoves:
+            break
+        sharedAlpha.value = -CHECKMATE
+        moveID, alpha, exact, nodes, firstLine = pool.submit(SearchRootMove, gs, rootMoves[0].moveID, depth,
+                                                             -CHECKMATE, deadline, deterministic, stopID).result()
+        counter += nodes
+        if alpha is None:
+            break
+        scores = {moveID: alpha}
+        depthExact = {moveID: alpha}
+        lines = {moveID: firstLine}
+        futures = [pool.submit(SearchRootMove, gs, move.moveID, depth, alpha, deadline, deterministic, stopID)
+                   for move in rootMoves[1:]]
+        stopped = False
+        for future in futures:
+            moveID, score, exact, nodes, line = future.result()
+            counter += nodes
+            if score is None:
+                stopped = True
+            scores[moveID] = score
+            if exact:
+                depthExact[moveID] = score
+            lines[moveID] = line
+        if stopped:
+            break
+        exactScores.update(depthExact)
+        # the best move is the best exact score, bounds are never above the alpha it was searched against
+        # stable sorts, so ties keep the earlier move
+        bestMove = max(rootMoves, key=lambda move: depthExact.get(move.moveID, -CHECKMATE - 1))
+        bestScore = scores[bestMove.moveID]
+        rootMoves.remove(bestMove)
+        rootMoves.sort(key=lambda move: exactScores.get(move.moveID, -CHECKMATE - 1), reverse=True)
+        rootMoves.insert(0, bestMove)
+        if infoCallback is not None:
+            infoCallback(depth, bestMove, bestScore, counter, lines[bestMove.moveID])
+        if abs(bestScore) >= MATE_THRESHOLD or StopRequested():
+            break
+        if timeLimit is not None:
+            deadline = time.time() + timeLimit - (time.perf_counter() - startTime)
+            if time.time() >= deadline:
+                break
+    return bestMove
+
+
+# Worker side of the parallel search: plays one root move and searches the reply with the window (alpha, CHECKMATE)
+# returns (moveID, score, exact, nodes, principal variation), with a score of None if it was stopped first
+# exact is False when the move failed low, then the score is only an upper bound
+def SearchRootMove(gs, moveID, depth, alpha, deadline, deterministic, searchID):
+    global rootDepth, searchNodes, searchDeadline, searchNodeLimit, counter, stopID, searchStopSignal
+    if deterministic:
+        transpositionTable.Isolate()  # as good as empty, without wiping the buffer for every root move
+        ClearOrderingTables()
+    else:
+        alpha = max(alpha, sharedAlpha.value)
+    rootDepth = depth
+    searchNodes = counter = 0
+    searchDeadline = None if deadline is None else time.perf_counter() + deadline - time.time()
+    searchNodeLimit = None
+    stopID = searchID
+    searchStopSignal = stopSignal if depth > 1 else None
+    move = gs.GetLegalMoveByID(moveID)
+    gs.MakeMove(move)
+    try:
+        score = -FindMoveNegaMaxAlphaBeta(gs, None, depth - 1, -CHECKMATE, -alpha, 1 if gs.whiteToMove else -1)
+    except SearchStopped:
+        return moveID, None, False, searchNodes, []
+    finally:
+        searchDeadline = searchStopSignal = None
+    if not deterministic:
+        with sharedAlpha.get_lock():
+            if score > sharedAlpha.value:
+                sharedAlpha.value = score
+    gs.UndoMove()
+    return moveID, score, score > alpha, searchNodes, PrincipalVariation(gs, move, depth)
+
+
+# runs once in each worker process - attaches the shared alpha, stop signal and transposition table
+def InitSearchWorker(alpha, tableName, signal):
+    global sharedAlpha, sharedTable, transpositionTable, stopSignal
+    sharedAlpha = alpha
+    stopSignal = signal
+    if tableName is None:
+        transpositionTable = TranspositionTable.TranspositionTable(TT_SIZE_MB)
+    else:
+        sharedTable = shared_memory.SharedMemory(name=tableName)
+        transpositionTable = TranspositionTable.TranspositionTable(buffer=sharedTable.buf)
+
+
+# the pool is kept between moves and only restarted when the worker count, mode or stop signal changes
+def GetSearchPool(workers, deterministic, signal):
+    global searchPool, searchPoolSettings, sharedAlpha, sharedTable
+    if searchPool is not None and searchPoolSettings == (workers, deterministic, signal):
+        return searchPool
+    if searchPool is None:
+        atexit.register(ShutdownSearchPool)
+    ShutdownSearchPool()
+    sharedAlpha = multiprocessing.Value("d", -CHECKMATE)
+    tableName = None
+    if not deterministic:
+        sharedTable = shared_memory.SharedMemory(create=True, size=int(TT_SIZE_MB * 1024 * 1024))
+        tableName = sharedTable.name
+    searchPool = ProcessPoolExecutor(workers, initializer=InitSearchWorker,
+                                     initargs=(sharedAlpha, tableName, signal))
+    searchPoolSettings = (workers, deterministic, signal)
+    return searchPool
+
+
+def ShutdownSearchPool():
+    global searchPool, searchPoolSettings, sharedTable
+    if searchPool is not None:
+        searchPool.shutdown()
+        searchPool = searchPoolSettings = None
+    if sharedTable is not None:
+        sharedTable.close()
+        sharedTable.unlink()
+        sharedTable = None
+
+
+# validMoves is the move list at the root - below it moves come from PickMoves, a stage at a time
 def FindMoveNegaMaxAlphaBeta(gs, validMoves, depth, alpha, beta, turnMultiplier):
     global nextMove
+    CountNode()
+    ply = rootDepth - depth
+    if depth != rootDepth and depth > 0:  # leaves are left to the quiescence search
+        result = Tablebase.Probe(gs)
+        if result is not None:
+            return TablebaseScore(result)
     if depth == 0:
-        return turnMultiplier * ScoreBoard(gs)
+        # captures and promotions start the quiescence search - all moves are only generated in check,
+        # where they show checkmate, so a stalemate right at the horizon goes unseen
+        if gs.InCheck():
+            captures = [m for m in gs.GetValidMoves() if m.isCapture or m.isPawnPromotion]
+        else:
+            captures = gs.GetCaptureMoves()
+        return Quiescence(gs, alpha, beta, turnMultiplier, ply, captures)
+
+    alphaOriginal = alpha
+    hashMoveID = 0
+    entry = transpositionTable.Probe(gs.zobristKey)
+    if entry is not None:
+        entryDepth, entryScore, bound, hashMoveID = entry
+        entryScore = ScoreFromTable(entryScore, ply)
+        if entryDepth >= depth and depth != rootDepth:  # the root always searches so it can set nextMove
+            if bound == TranspositionTable.EXACT:
+                return entryScore
+            elif bound == TranspositionTable.LOWER_BOUND:
+                alpha = max(alpha, entryScore)
+            else:
+                beta = min(beta, entryScore)
+            if alpha >= beta:
+                return entryScore
+
+    if depth == rootDepth:
+        OrderMoves(validMoves, hashMoveID, ply)
+        moves = validMoves
+    else:
+        moves = PickMoves(gs, hashMoveID, ply)
 
-    # move ordering - implement later
     maxScore = -CHECKMATE
-    for move in validMoves:
+    bestMoveID = 0
+    i = -1
+    for i, move in enumerate(moves):
         gs.MakeMove(move)
-        nextMoves = gs.GetValidMoves()
-        score = -FindMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier)
+        score = -FindMoveNegaMaxAlphaBeta(gs, None, depth - 1, -beta, -alpha, -turnMultiplier)
         if score > maxScore:
             maxScore = score
-            if depth == DEPTH_NEGAMAX:
+            bestMoveID = move.moveID
+            if depth == rootDepth:
                 nextMove = move
-                print(f"{move}: {round(score * 10) / 10}")
         gs.UndoMove()
         if maxScore > alpha:  # pruning
             alpha = maxScore
         if alpha >= beta:
+            RecordCutoff(move, depth, ply, i == 0)
             break
+    if i == -1:  # no legal moves
+        maxScore = ply - CHECKMATE if gs.InCheck() else STALEMATE  # a mate further from the root scores less
+
+    if maxScore <= alphaOriginal:  # every move failed low, so the score is at most maxScore
+        bound = TranspositionTable.UPPER_BOUND
+    elif maxScore >= beta:  # cut off, so the score is at least maxScore
+        bound = TranspositionTable.LOWER_BOUND
+    else:
+        bound = TranspositionTable.EXACT
+    transpositionTable.Store(gs.zobristKey, depth, ScoreToTable(maxScore, ply), bound, bestMoveID)
     return maxScore
 
 
+# mate scores count plies from the root, the table keeps them counted from the stored position instead
+# so they stay right when the position turns up again at another ply or in a later search
+def ScoreToTable(score, ply):
+    if score >= MATE_THRESHOLD:
+        return score + ply
+    if score <= -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+
+def ScoreFromTable(score, ply):
+    if score >= MATE_THRESHOLD:
+        return score - ply
+    if score <= -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+
+# moves to mate for a search score, negative when the side to move is the one getting mated
+# None when the score isn't a mate
+def MateIn(score):
+    if abs(score) < MATE_THRESHOLD:
+        return None
+    plies = round(CHECKMATE - abs(score))
+    return (plies + 1) // 2 if score > 0 else -(plies // 2)
+
+
+# Searches captures and promotions only until the position is quiet, so the leaves aren't mid-exchange
+# captures can be passed in when the caller has already generated them
+def Quiescence(gs, alpha, beta, turnMultiplier, ply, captures=None):
+    CountNode()
+    standPat = turnMultiplier * ScoreBoard(gs)
+    if gs.checkmate:
+        return ply - CHECKMATE
+    if gs.stalemate:
+        return standPat
+    if standPat >= beta:  # standing pat is already good enough
+        return standPat
+    if standPat > alpha:
+        alpha = standPat
+
+    if captures is None:
+        captures = gs.GetCaptureMoves()
+    OrderMoves(captures, 0, 0)
+    for move in captures:
+        # delta pruning - skip captures that can't raise alpha even if the piece is won for free
+        if not move.isPawnPromotion and standPat + pieceScore[move.pieceCaptured[1]] + DELTA_MARGIN < alpha:
+            continue
+        gs.MakeMove(move)
+        score = -Quiescence(gs, -beta, -alpha, -turnMultiplier, ply + 1)
+        gs.UndoMove()
+        if score >= beta:
+            return score
+        if score > alpha:
+            alpha = score
+    return alpha
+
+
+# counts a searched node and stops the search once the time or node budget is spent
+def CountNode():
+    global searchNodes
+    searchNodes += 1
+    if searchNodes % NODE_CHECK_INTERVAL == 0:
+        if (searchDeadline is not None and time.perf_counter() >= searchDeadline) or \
+                (searchNodeLimit is not None and searchNodes >= searchNodeLimit) or \
+                (searchStopSignal is not None and searchStopSignal.value >= stopID):
+            raise SearchStopped()
+
+
+# Lets another process stop the search and follow its progress: the search stops once signal.value >= searchID,
+# and callback is called with (depth, move, score, nodes, principal variation) after each finished depth
+def SetSearchControl(signal=None, searchID=0, callback=None):
+    global stopSignal, stopID, infoCallback
+    stopSignal = signal
+    stopID = searchID
+    infoCallback = callback
+
+
+def StopRequested():
+    return stopSignal is not None and stopSignal.value >= stopID
+
+
+# the expected line of play starting with move, read back from the hash moves in the transposition table
+def PrincipalVariation(gs, move, maxLength):
+    line = [move]
+    gs.MakeMove(move)
+    while len(line) < maxLength:
+        entry = transpositionTable.Probe(gs.zobristKey)
+        nextMove = gs.GetLegalMoveByID(entry[3]) if entry is not None and entry[3] else None
+        if nextMove is None:
+            break
+        line.append(nextMove)
+        gs.MakeMove(nextMove)
+    for _ in line:
+        gs.UndoMove()
+    return line
+
+
+# Sorts moves best-first: hash move, captures by most valuable victim then least valuable attacker,
+# the two killer moves for this ply, then quiet moves by their history score
+def OrderMoves(moves, hashMoveID, ply):
+    killers = killerMoves[ply]
+
+    def MoveOrder(move):
+        if move.moveID == hashMoveID:
+            return 3000000
+        if move.pieceCaptured != "--" or move.isPawnPromotion:
+            victim = captureOrderScore[move.pieceCaptured[1]] if move.pieceCaptured != "--" else 0
+            return 2000000 + victim * 100 - captureOrderScore[move.pieceMoved[1]] + \
+                (captureOrderScore["Q"] * 100 if move.isPawnPromotion else 0)
+        if move.moveID == killers[0]:
+            return 1000001
+        if move.moveID == killers[1]:
+            return 1000000
+        return historyScores.get(move.moveID, 0)
+
+    moves.sort(key=MoveOrder, reverse=True)
+
+
+# Yields moves best-first a stage at a time: the hash move, winning captures, the killer moves, quiet moves
+# by history, then losing captures - each stage is only generated once the stage before it runs out,
+# so a cutoff on an early move skips generating the rest
+def PickMoves(gs, hashMoveID, ply):
+    if hashMoveID:
+        hashMove = gs.GetLegalMoveByID(hashMoveID)
+        if hashMove is not None:
+            yield hashMove
+
+    captures = gs.GetCaptureMoves()
+    OrderMoves(captures, 0, ply)
+    losingCaptures = []
+    for move in captures:
+        if move.moveID == hashMoveID:
+            continue
+        if IsLosingCapture(gs, move):
+            losingCaptures.append(move)
+        else:
+            yield move
+
+    played = {hashMoveID}
+    for killerID in tuple(killerMoves[ply]):
+        if killerID and killerID not in played:
+            killer = gs.GetLegalMoveByID(killerID)
+            if killer is not None and not killer.isCapture and not killer.isPawnPromotion:
+                played.add(killerID)
+                yield killer
+
+    quiets = gs.GetQuietMoves()
+    OrderMoves(quiets, 0, ply)
+    for move in quiets:
+        if move.moveID not in played:
+            yield move
+
+    yield from losingCaptures
+
+
+# a capture of a cheaper piece onto a defended square - without a full exchange evaluation this is a guess
+def IsLosingCapture(gs, move):
+    if move.isPawnPromotion or captureOrderScore[move.pieceCaptured[1]] >= captureOrderScore[move.pieceMoved[1]]:
+        return False
+    return gs.SquareAttackedBy(move.endRow, move.endCol, not gs.whiteToMove)
+
+
+# a beta cutoff - quiet moves that cause one become killers and gain history
+def RecordCutoff(move, depth, ply, firstMove):
+    global cutoffs, firstMoveCutoffs
+    cutoffs += 1
+    if firstMove:
+        firstMoveCutoffs += 1
+    if move.pieceCaptured == "--" and not move.isPawnPromotion:
+        killers = killerMoves[ply]
+        if killers[0] != move.moveID:
+            killers[1] = killers[0]
+            killers[0] = move.moveID
+        historyScores[move.moveID] = min(historyScores.get(move.moveID, 0) + depth * depth, 999999)
+
+
+def ClearOrderingTables():
+    global cutoffs, firstMoveCutoffs
+    for killers in killerMoves:
+        killers[0] = killers[1] = 0
+    historyScores.clear()
+    cutoffs = firstMoveCutoffs = 0
+
+
+# fraction of beta cutoffs that came from the first move searched - the closer to 1, the better the ordering
+def FirstMoveCutoffRate():
+    return firstMoveCutoffs / cutoffs if cutoffs else 0
+
+
+# the table lives as long as this process does, so it carries over between moves of a game
+def GetTranspositionTable():
+    global transpositionTable
+    if transpositionTable is None:
+        transpositionTable = TranspositionTable.TranspositionTable(TT_SIZE_MB)
+    return transpositionTable
+
+
+# searches from here on use table, so players sharing a process can each keep their own
+def SetTranspositionTable(table):
+    global transpositionTable
+    transpositionTable = table
+
+
+def SetHashSize(sizeMB):
+    global TT_SIZE_MB, transpositionTable
+    TT_SIZE_MB = sizeMB
+    transpositionTable = None
+
+
+# the book is opened on first use and stays mapped, later lookups only touch the pages they read
+def GetOpeningBook():
+    global openingBook
+    if openingBook is None:
+        openingBook = OpeningBook.OpeningBook(BOOK_FILE) if BOOK_FILE and os.path.exists(BOOK_FILE) else False
+    return openingBook or None
+
+
+# path None plays without a book
+def SetOpeningBook(path, selection=OpeningBook.WEIGHTED):
+    global BOOK_FILE, BOOK_SELECTION, openingBook
+    if openingBook:
+        openingBook.Close()
+    BOOK_FILE = path
+    BOOK_SELECTION = selection
+    openingBook = None
+
+
+# a move from the opening book, or None when there is no book or the position isn't in it
+def BookMove(gs):
+    book = GetOpeningBook()
+    return book.ChooseMove(gs, BOOK_SELECTION) if book is not None else None
+
+
+# A move that needs no search: the searching levels play from the opening book while it lasts,
+# and skill levels 4 and 5 play perfectly once the tablebases cover the position
+def KnownMove(skillLevel, gs, validMoves):
+    move = BookMove(gs) if skillLevel >= 3 else None
+    if move is None and skillLevel >= 4:
+        move = Tablebase.BestMove(gs, validMoves)
+    return move
+
+
+# a tablebase result as a score for the side to move - shorter wins score higher, longer losses less low
+def TablebaseScore(result):
+    outcome, plies = result
+    return outcome * (TABLEBASE_WIN - plies)
+
+
 # Positive score is good for white
 # Negative score is good for black
 
@@ -233,23 +723,7 @@ def ScoreBoard(gs):
     elif gs.stalemate:
         return STALEMATE
 
-    score = 0
-    for row in range(len(gs.board)):
-        for col in range(len(gs.board[row])):
-            square = gs.board[row][col]
-            if square != "--":
-                # score positionally
-
-                if square[1] == "P":  # for pawns
-                    piecePositionScore = piecePositionScores[square][row][col]
-                else:  # for other pieces
-                    piecePositionScore = piecePositionScores[square[1]][row][col]
-
-                if square[0] == "w":
-                    score += pieceScore[square[1]] + piecePositionScore * 0.1
-                elif square[0] == "b":
-                    score -= pieceScore[square[1]] + piecePositionScore * 0.1
-    return score
+    return gs.boardScore / 10  # kept up to date by MakeMove and UndoMove
 
 
 # get score based on the board's pieces
@@ -0,0 +1,394 @@
+"""
+Endgame tablebases for king and queen, king and rook, king and pawn, and king, bishop and knight against a lone king
+Built offline by retrograde analysis: starting from every checkmate the positions are walked backwards one ply
+at a time, so each one gets its exact distance to mate
+A table is two byte arrays, white to move then black to move, with one byte per placement of the pieces:
+0 for a draw or an impossible placement, otherwise the plies to mate plus one
+Tables always have the pieces on white's side - positions where black has them are probed colour-flipped
+Tables without pawns use the board's 8 symmetries, so the white king only needs 10 squares
+The engine only ever promotes to a queen, so KPK distances are for queen promotions
+Run "python Tablebase.py" to build the missing tables into the tablebases folder - KBNK takes a few minutes
+"""
+
+import argparse
+import mmap
+import os
+import sys
+import time
+
+# the white pieces besides the king in each table, in the order their squares are indexed
+TABLES = {"KQK": "Q", "KRK": "R", "KPK": "P", "KBNK": "BN"}
+BUILD_ORDER = ("KQK", "KRK", "KPK", "KBNK")  # KPK promotes into KQK, so KQK is built first
+PIECE_ORDER = "QRBNP"
+MAX_PIECES = 4
+TABLEBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+WIN, DRAW, LOSS = 1, 0, -1  # outcomes for the side to move
+NO_COUNT = 255  # remaining-moves marker for positions that can never be lost: illegal, stalemate or an escape
+
+
+def Steps(sq, offsets):
+    r, c = divmod(sq, 8)
+    return [(r + dr) * 8 + c + dc for dr, dc in offsets if 0 <= r + dr < 8 and 0 <= c + dc < 8]
+
+
+def Mask(squares):
+    mask = 0
+    for sq in squares:
+        mask |= 1 << sq
+    return mask
+
+
+KING_STEPS = [Steps(sq, ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))) for sq in range(64)]
+KNIGHT_STEPS = [Steps(sq, ((-2, -1), (-2, 1), (-1, -2), (1, -2), (1, 2), (2, -1), (2, 1), (-1, 2))) for sq in range(64)]
+KING_MASK = [Mask(steps) for steps in KING_STEPS]
+KNIGHT_MASK = [Mask(steps) for steps in KNIGHT_STEPS]
+PAWN_MASK = [Mask(Steps(sq, ((-1, -1), (-1, 1)))) for sq in range(64)]  # squares a white pawn attacks
+
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+
+
+# squares from sq outwards in each direction, nearest first
+def Rays(sq, directions):
+    r, c = divmod(sq, 8)
+    rays = []
+    for dr, dc in directions:
+        ray = []
+        nr, nc = r + dr, c + dc
+        while 0 <= nr < 8 and 0 <= nc < 8:
+            ray.append(nr * 8 + nc)
+            nr, nc = nr + dr, nc + dc
+        rays.append(ray)
+    return rays
+
+
+SLIDER_RAYS = {"R": [Rays(sq, ROOK_DIRECTIONS) for sq in range(64)],
+               "B": [Rays(sq, BISHOP_DIRECTIONS) for sq in range(64)],
+               "Q": [Rays(sq, ROOK_DIRECTIONS + BISHOP_DIRECTIONS) for sq in range(64)]}
+SLIDER_LINES = {pieceType: [Mask(s for ray in rays[sq] for s in ray) for sq in range(64)]
+                for pieceType, rays in SLIDER_RAYS.items()}
+BETWEEN = [[0] * 64 for _ in range(64)]  # squares strictly between two squares on a line
+for start in range(64):
+    for ray in SLIDER_RAYS["Q"][start]:
+        for i, end in enumerate(ray):
+            BETWEEN[start][end] = Mask(ray[:i])
+
+
+# sq under a board symmetry: bit 1 flips the rows, bit 2 the columns, bit 4 swaps rows and columns
+def TransformSquare(sq, transform):
+    r, c = divmod(sq, 8)
+    if transform & 1:
+        r = 7 - r
+    if transform & 2:
+        c = 7 - c
+    if transform & 4:
+        r, c = c, r
+    return r * 8 + c
+
+
+TRANSFORMS = [[TransformSquare(sq, transform) for sq in range(64)] for transform in range(8)]
+# a1-d1-d4: every square maps into it, the squares on the diagonal in two ways
+TRIANGLE = [sq for sq in range(64) if sq // 8 >= 4 and sq % 8 <= 3 and 7 - sq // 8 <= sq % 8]
+TRIANGLE_INDEX = {sq: i for i, sq in enumerate(TRIANGLE)}
+KING_TRANSFORMS = [[transform for transform in range(8) if TRANSFORMS[transform][sq] in TRIANGLE_INDEX]
+                   for sq in range(64)]
+
+loadedTables = {}  # name -> Table, or None when its file hasn't been built
+
+
+# whether a white piece on sq attacks target, with the pieces in occupied blocking sliders
+def Attacks(pieceType, sq, target, occupied):
+    if pieceType == "N":
+        return KNIGHT_MASK[sq] >> target & 1
+    if pieceType == "P":
+        return PAWN_MASK[sq] >> target & 1
+    if pieceType == "K":
+        return KING_MASK[sq] >> target & 1
+    return SLIDER_LINES[pieceType][sq] >> target & 1 and not BETWEEN[sq][target] & occupied
+
+
+class Table:
+    def __init__(self, name, data=None):
+        self.name = name
+        self.pieceTypes = TABLES[name]
+        self.symmetric = "P" not in self.pieceTypes
+        # squares are (white king, black king, the other white pieces)
+        self.size = (len(TRIANGLE) if self.symmetric else 64) * 64 ** (len(self.pieceTypes) + 1)
+        self.data = data  # white to move, then black to move
+
+    # index of a placement, through the symmetry that puts it in its smallest form when the table has no pawns
+    def Index(self, squares):
+        if self.symmetric:
+            transforms = KING_TRANSFORMS[squares[0]]
+            mapping = TRANSFORMS[transforms[0]]
+            best = [mapping[sq] for sq in squares]
+            if len(transforms) > 1:  # the king is on the diagonal, flipping along it gives another form
+                mapping = TRANSFORMS[transforms[1]]
+                other = [mapping[sq] for sq in squares]
+                best = min(best, other)
+            index = TRIANGLE_INDEX[best[0]]
+            squares = best[1:]
+        else:
+            index = 0
+        for sq in squares:
+            index = index * 64 + sq
+        return index
+
+    def Squares(self, index):
+        squares = []
+        for _ in range(len(self.pieceTypes) + 1):
+            index, sq = divmod(index, 64)
+            squares.append(sq)
+        squares.append(TRIANGLE[index] if self.symmetric else index)
+        squares.reverse()
+        return squares
+
+    # the stored byte: 0 for a draw, otherwise the plies to mate plus one
+    def Lookup(self, squares, whiteToMove):
+        return self.data[self.Index(squares) + (0 if whiteToMove else self.size)]
+
+    # whether the placement can occur with that side to move
+    def Legal(self, squares, whiteToMove):
+        if len(set(squares)) < len(squares) or KING_MASK[squares[0]] >> squares[1] & 1:
+            return False
+        for pieceType, sq in zip(self.pieceTypes, squares[2:]):
+            if pieceType == "P" and (sq < 8 or sq >= 56):
+                return False
+        return not whiteToMove or not self.InCheck(squares)
+
+    # whether the black king is attacked
+    def InCheck(self, squares):
+        occupied = Mask(squares)
+        return any(Attacks(pieceType, sq, squares[1], occupied) for pieceType, sq in zip(self.pieceTypes, squares[2:]))
+
+    # indexes of the positions black's moves lead to, or None when black can take a piece and draw
+    def BlackMoves(self, squares):
+        whiteKing, blackKing = squares[0], squares[1]
+        others = squares[2:]
+        occupied = Mask(squares) & ~(1 << blackKing)  # the king doesn't block attacks on the squares behind it
+        successors = set()
+        for to in KING_STEPS[blackKing]:
+            if to == whiteKing or KING_MASK[whiteKing] >> to & 1:
+                continue
+            left = occupied & ~(1 << to)
+            if any(sq != to and Attacks(pieceType, sq, to, left) for pieceType, sq in zip(self.pieceTypes, others)):
+                continue
+            if to in others:  # a lone minor piece or a bare king can't mate
+                return None
+            successors.add(self.Index([whiteKing, to] + others))
+        return successors
+
+    # indexes of the white-to-move positions that lead here with one white move
+    def WhiteUnmoves(self, squares):
+        blackKing = squares[1]
+        occupied = Mask(squares)
+        predecessors = []
+        for i, pieceType in enumerate("K" + self.pieceTypes):
+            position = 0 if i == 0 else i + 1
+            sq = squares[position]
+            if pieceType == "K":
+                starts = [s for s in KING_STEPS[sq] if not occupied >> s & 1 and not KING_MASK[blackKing] >> s & 1]
+            elif pieceType == "N":
+                starts = [s for s in KNIGHT_STEPS[sq] if not occupied >> s & 1]
+            elif pieceType == "P":  # back down the board, two squares from the fourth rank
+                starts = []
+                if sq < 48 and not occupied >> (sq + 8) & 1:
+                    starts.append(sq + 8)
+                    if sq // 8 == 4 and not occupied >> (sq + 16) & 1:
+                        starts.append(sq + 16)
+            else:
+                starts = []
+                for ray in SLIDER_RAYS[pieceType][sq]:
+                    for s in ray:
+                        if occupied >> s & 1:
+                            break
+                        starts.append(s)
+            for start in starts:
+                previous = list(squares)
+                previous[position] = start
+                if not self.InCheck(previous):
+                    predecessors.append(self.Index(previous))
+        return predecessors
+
+    # indexes of the black-to-move positions that lead here with one black move
+    def BlackUnmoves(self, squares):
+        whiteKing = squares[0]
+        occupied = Mask(squares)
+        return {self.Index([whiteKing, start] + squares[2:]) for start in KING_STEPS[squares[1]]
+                if not occupied >> start & 1 and not KING_MASK[whiteKing] >> start & 1}
+
+
+# Retrograde analysis: checkmates are lost in 0 plies, a white-to-move position is won when one move reaches
+# a lost position, and a black-to-move position is lost once every one of its moves reaches a won position
+# positions are settled in order of distance, so each distance is the shortest for the winner and longest for the loser
+def Generate(name, progress=None):
+    table = Table(name)
+    size = table.size
+    whiteToMove = bytearray(size)
+    blackToMove = bytearray(size)
+    remaining = bytearray([NO_COUNT]) * size  # black moves not yet known to lose
+    whiteWins = [[]]  # white-to-move indexes by plies to mate
+    blackLosses = [[]]
+
+    for index in range(size):
+        squares = table.Squares(index)
+        if table.Index(squares) != index or not table.Legal(squares, False):  # a duplicate by symmetry, or impossible
+            continue
+        successors = table.BlackMoves(squares)
+        if successors is None:
+            continue
+        if successors:
+            remaining[index] = len(successors)
+        elif table.InCheck(squares):
+            blackToMove[index] = 1
+            blackLosses[0].append(index)
+
+    if "P" in table.pieceTypes:  # queen promotions, settled by the KQK table
+        queens = LoadTable("KQK") or Table("KQK", Generate("KQK"))
+        for index in range(size):
+            squares = table.Squares(index)
+            pawn = squares[2]
+            if 8 <= pawn < 16 and pawn - 8 not in squares and table.Legal(squares, True):
+                stored = queens.Lookup([squares[0], squares[1], pawn - 8], False)
+                if stored and (whiteToMove[index] == 0 or whiteToMove[index] > stored + 1):
+                    whiteToMove[index] = stored + 1
+                    while len(whiteWins) <= stored:
+                        whiteWins.append([])
+                    whiteWins[stored].append(index)
+
+    plies = 0
+    while any(whiteWins[plies:]) or any(blackLosses[plies:]):
+        for settled in (whiteWins, blackLosses):
+            while len(settled) <= plies + 1:
+                settled.append([])
+        for index in blackLosses[plies]:
+            for previous in table.WhiteUnmoves(table.Squares(index)):
+                if whiteToMove[previous] == 0 or whiteToMove[previous] > plies + 2:
+                    whiteToMove[previous] = plies + 2
+                    whiteWins[plies + 1].append(previous)
+        for index in whiteWins[plies]:
+            if whiteToMove[index] != plies + 1:  # reached sooner than the promotion that first settled it
+                continue
+            for previous in table.BlackUnmoves(table.Squares(index)):
+                if remaining[previous] != NO_COUNT and remaining[previous] > 0:
+                    remaining[previous] -= 1
+                    if remaining[previous] == 0:
+                        blackToMove[previous] = plies + 2
+                        blackLosses[plies + 1].append(previous)
+        if progress is not None:
+            progress(plies, len(whiteWins[plies]), len(blackLosses[plies]))
+        whiteWins[plies] = blackLosses[plies] = []
+        plies += 1
+    return whiteToMove + blackToMove
+
+
+def TablePath(name):
+    return os.path.join(TABLEBASE_DIR, name + ".tb")
+
+
+# builds a table and writes it to the tablebases folder, replacing the file only once it is complete
+def Build(name, progress=None):
+    data = Generate(name, progress)
+    os.makedirs(TABLEBASE_DIR, exist_ok=True)
+    temporary = TablePath(name) + ".tmp"
+    with open(temporary, "wb") as tableFile:
+        tableFile.write(data)
+    os.replace(temporary, TablePath(name))
+    loadedTables.pop(name, None)
+    return data
+
+
+# the table mapped from its file, or None when it hasn't been built
+def LoadTable(name):
+    if name not in loadedTables:
+        table = None
+        if os.path.exists(TablePath(name)):
+            table = Table(name)
+            with open(TablePath(name), "rb") as tableFile:
+                table.data = mmap.mmap(tableFile.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(table.data) != 2 * table.size:  # left by a different layout, ignore it
+                table = None
+        loadedTables[name] = table
+    return loadedTables[name]
+
+
+# (outcome, plies to mate) for the side to move, or None when no table covers the position
+# bare kings and a lone minor piece are draws without a table
+def Probe(gs):
+    if gs.pieceCount > MAX_PIECES:
+        return None
+    if gs.currentCastlingRights.wks or gs.currentCastlingRights.wqs or \
+            gs.currentCastlingRights.bks or gs.currentCastlingRights.bqs:
+        return None
+    pieces = {"w": [], "b": []}
+    kings = {}
+    for r, row in enumerate(gs.board):
+        for c, piece in enumerate(row):
+            if piece[1] == "K":
+                kings[piece[0]] = r * 8 + c
+            elif piece != "--":
+                pieces[piece[0]].append((PIECE_ORDER.index(piece[1]), r * 8 + c))
+    if pieces["w"] and pieces["b"]:
+        return None
+    strong = "w" if pieces["w"] else "b"
+    others = sorted(pieces[strong])
+    material = "".join(PIECE_ORDER[kind] for kind, _ in others)
+    if material in ("", "B", "N"):
+        return DRAW, 0
+    name = "K" + material + "K"
+    table = LoadTable(name) if name in TABLES else None
+    if table is None:
+        return None
+    flip = 56 if strong == "b" else 0  # mirror the rows so the pieces are white's and pawns still run up the board
+    squares = [kings[strong] ^ flip, kings["b" if strong == "w" else "w"] ^ flip] + [sq ^ flip for _, sq in others]
+    strongToMove = gs.whiteToMove == (strong == "w")
+    stored = table.Lookup(squares, strongToMove)
+    if stored == 0:
+        return DRAW, 0
+    return (WIN if strongToMove else LOSS), stored - 1
+
+
+# the best move by the tables - the fastest win, else a draw, else the slowest loss - or None when they don't cover it
+def BestMove(gs, validMoves):
+    if not validMoves or Probe(gs) is None:
+        return None
+    bestMove = None
+    bestRank = None
+    for move in validMoves:
+        gs.MakeMove(move)
+        result = Probe(gs)
+        gs.UndoMove()
+        if result is None:
+            return None
+        outcome, plies = -result[0], result[1]  # the opponent's result turned round
+        rank = (outcome, -plies if outcome == WIN else plies)
+        if bestRank is None or rank > bestRank:
+            bestMove, bestRank = move, rank
+    return bestMove
+
+
+def Main(argv=None):
+    parser = argparse.ArgumentParser(description="Build endgame tablebases by retrograde analysis")
+    parser.add_argument("tables", nargs="*", help=f"tables to build from {', '.join(BUILD_ORDER)} "
+                                                  f"(default: every one not built yet)")
+    parser.add_argument("--rebuild", action="store_true", help="build tables that already exist again")
+    args = parser.parse_args(argv)
+    for name in args.tables:
+        if name not in TABLES:
+            parser.error(f"unknown table {name}")
+
+    for name in args.tables or BUILD_ORDER:
+        if os.path.exists(TablePath(name)) and not args.rebuild:
+            print(f"{name}: already built")
+            continue
+        start = time.perf_counter()
+        data = Build(name, lambda plies, wins, losses: print(f"{name}: {plies} plies, {wins} white wins, "
+                                                             f"{losses} black losses", end="\r"))
+        decisive = sum(1 for value in data if value)
+        print(f"{name}: {decisive} decisive positions, longest mate {max(data) - 1} plies, "
+              f"{round(time.perf_counter() - start, 1)}s, written to {TablePath(name)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(Main())
@@ -0,0 +1,179 @@
+"""
+Headless engine-vs-engine matches
+Plays games between two AI configurations across a process pool with no display,
+writing one record per game to a JSON-lines file
+Each engine searches with its own transposition table and fresh move ordering tables, so neither learns from the other
+Each opening is played twice with the colours swapped, games past the move limit are adjudicated as draws
+Run "python Tournament.py --games 100 --engine-a 5 --time-a 0.5 --engine-b 3"
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import BitboardEngine
+import ChessEngine
+import SmartMoveFinder
+import TranspositionTable
+
+# short opening lines in coordinate notation, so games don't all follow the same path
+OPENINGS = [
+    "e2e4 e7e5 g1f3 b8c6",
+    "e2e4 c7c5 g1f3 d7d6",
+    "e2e4 e7e6 d2d4 d7d5",
+    "e2e4 c7c6 d2d4 d7d5",
+    "d2d4 d7d5 c2c4 e7e6",
+    "d2d4 g8f6 c2c4 g7g6",
+    "d2d4 g8f6 c2c4 e7e6",
+    "c2c4 e7e5 b1c3 g8f6",
+    "g1f3 d7d5 g2g3 g8f6",
+    "e2e4 d7d5 e4d5 d8d5",
+    "e2e4 g8f6 e4e5 f6d5",
+    "d2d4 f7f5 g2g3 g8f6",
+]
+
+BACKENDS = {"list": ChessEngine.GameState, "bitboard": BitboardEngine.BitboardGameState}
+
+
+class EngineConfig:
+    def __init__(self, name, skillLevel, timeLimit=None):
+        self.name = name
+        self.skillLevel = skillLevel
+        self.timeLimit = timeLimit
+
+    def __str__(self):
+        return f"skill {self.skillLevel}" + (f" at {self.timeLimit}s/move" if self.timeLimit else "")
+
+
+# plays one game in a worker process and returns its record
+def PlayGame(gameNumber, opening, white, black, maxMoves, seed, backend="bitboard"):
+    # a fresh seed and empty tables, so a game plays the same whichever worker gets it
+    random.seed(seed * 100003 + gameNumber)
+    tables = {engine.name: TranspositionTable.TranspositionTable(SmartMoveFinder.TT_SIZE_MB)
+              for engine in (white, black)}
+    gs = BACKENDS[backend]()
+    moves = opening.split()
+    for text in moves:
+        gs.MakeMove(gs.GetMoveFromCoordinates(text))
+    boards = {white.name: 0, black.name: 0}  # ScoreBoard calls, the board count FindMove returns
+    nodes = {white.name: 0, black.name: 0}  # positions visited by the skill level 5 search
+    thinking = {white.name: 0.0, black.name: 0.0}
+    start = time.perf_counter()
+    result, reason = "1/2-1/2", "move limit"
+    while len(gs.moveLog) < maxMoves * 2:
+        validMoves = gs.GetValidMoves()
+        if gs.checkmate:
+            result, reason = ("0-1" if gs.whiteToMove else "1-0"), "checkmate"
+            break
+        if gs.stalemate:
+            reason = "stalemate"
+            break
+        if gs.zobristKeyLog.count(gs.zobristKey) >= 2:  # the third time this position is on the board
+            reason = "repetition"
+            break
+        engine = white if gs.whiteToMove else black
+        SmartMoveFinder.SetTranspositionTable(tables[engine.name])
+        SmartMoveFinder.ClearOrderingTables()
+        SmartMoveFinder.searchNodes = 0  # only the skill level 5 search counts nodes
+        moveStart = time.perf_counter()
+        move, scored = SmartMoveFinder.FindMove(engine.skillLevel, validMoves, gs, engine.timeLimit, workers=1)
+        thinking[engine.name] += time.perf_counter() - moveStart
+        boards[engine.name] += scored
+        nodes[engine.name] += SmartMoveFinder.searchNodes
+        if move is None:
+            move = SmartMoveFinder.RandomMove(validMoves)
+        moves.append(move.GetCoordinates())
+        gs.MakeMove(move)
+    return {"game": gameNumber, "opening": opening, "white": white.name, "black": black.name,
+            "result": result, "reason": reason, "plies": len(gs.moveLog),
+            "seconds": round(time.perf_counter() - start, 3),
+            "thinkingSeconds": {name: round(seconds, 3) for name, seconds in thinking.items()},
+            "boards": boards, "nodes": nodes, "moves": " ".join(moves)}
+
+
+# score of engine A in one game: 1 for a win, 0.5 for a draw, 0 for a loss
+def GameScore(record, name):
+    if record["result"] == "1/2-1/2":
+        return 0.5
+    return 1.0 if (record["result"] == "1-0") == (record["white"] == name) else 0.0
+
+
+def EloDifference(score):
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+
+# (wins, draws, losses, Elo difference, 95% error margin) of engine A
+def Summary(records, name):
+    scores = [GameScore(record, name) for record in records]
+    wins, draws = scores.count(1.0), scores.count(0.5)
+    losses = len(scores) - wins - draws
+    mean = sum(scores) / len(scores)
+    deviation = math.sqrt(sum((s - mean) ** 2 for s in scores) / len(scores))
+    margin = 1.96 * deviation / math.sqrt(len(scores))
+    elo = EloDifference(mean)
+    if 0 < mean < 1:
+        errorBar = (EloDifference(min(mean + margin, 1)) - EloDifference(max(mean - margin, 0))) / 2
+    else:  # every game won or every game lost - the difference has no upper bound
+        errorBar = math.inf
+    return wins, draws, losses, elo, errorBar
+
+
+def PrintSummary(records, engineA, engineB):
+    wins, draws, losses, elo, errorBar = Summary(records, engineA.name)
+    print(f"\n{'':12}{'win':>6}{'draw':>6}{'loss':>6}")
+    print(f"{'A ' + str(engineA.skillLevel):12}{wins:>6}{draws:>6}{losses:>6}")
+    print(f"{'B ' + str(engineB.skillLevel):12}{losses:>6}{draws:>6}{wins:>6}")
+    print(f"A: {engineA}, B: {engineB}, {len(records)} games")
+    print(f"Elo difference (A - B): {elo:+.1f} +/- {errorBar:.1f}")
+
+
+def Main(argv=None):
+    parser = argparse.ArgumentParser(description="Play AI against AI without a display")
+    parser.add_argument("--games", type=int, default=20, help="rounded up to an even number so colours balance")
+    parser.add_argument("--engine-a", type=int, default=5, help="skill level of engine A")
+    parser.add_argument("--engine-b", type=int, default=3, help="skill level of engine B")
+    parser.add_argument("--time-a", type=float, help="seconds per move for engine A (skill level 5)")
+    parser.add_argument("--time-b", type=float, help="seconds per move for engine B (skill level 5)")
+    parser.add_argument("--max-moves", type=int, default=100, help="moves each before the game is a draw")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="bitboard")
+    parser.add_argument("--output", default="tournament.jsonl", help="JSON-lines file for the game records")
+    args = parser.parse_args(argv)
+
+    engineA = EngineConfig("A", args.engine_a, args.time_a)
+    engineB = EngineConfig("B", args.engine_b, args.time_b)
+    games = []
+    for i in range((args.games + 1) // 2):
+        opening = OPENINGS[i % len(OPENINGS)]
+        games.append((opening, engineA, engineB))
+        games.append((opening, engineB, engineA))
+
+    records = []
+    start = time.perf_counter()
+    with open(args.output, "w") as output, ProcessPoolExecutor(args.workers) as pool:
+        futures = [pool.submit(PlayGame, number, opening, white, black, args.max_moves, args.seed, args.backend)
+                   for number, (opening, white, black) in enumerate(games, 1)]
+        for future in as_completed(futures):
+            record = future.result()
+            records.append(record)
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            print(f"game {record['game']}: {record['white']} vs {record['black']} {record['result']} "
+                  f"({record['reason']}, {record['plies']} plies, {record['seconds']}s)")
+    print(f"{len(records)} games in {time.perf_counter() - start:.1f}s, records in {args.output}")
+    PrintSummary(records, engineA, engineB)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(Main())
@@ -0,0 +1,86 @@
+"""
+Fixed-size transposition table for the negamax search
+Entries live in one flat buffer sized from a memory budget, so the table never grows during a game
+Each bucket holds two entries: the first keeps the deepest search of the position, the second is always replaced
+The key is stored XORed with the other two words, so when several processes share the buffer,
+an entry torn by two writers at once just fails to match rather than returning another position's data
+"""
+
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+
+ENTRY_WORDS = 3  # key, packed depth/bound/move/generation, score - 8 bytes each
+ENTRY_SIZE = ENTRY_WORDS * 8
+BUCKET_SIZE = 2
+
+
+class TranspositionTable:
+    def __init__(self, sizeMB=16, buffer=None):
+        if buffer is None:
+            buffer = bytearray(int(sizeMB * 1024 * 1024))
+        # round the bucket count down to a power of two so the index is a mask of the key
+        bucketCount = 1
+        while bucketCount * 2 * BUCKET_SIZE * ENTRY_SIZE <= len(buffer):
+            bucketCount *= 2
+        self.buffer = buffer
+        self.mask = bucketCount - 1
+        view = memoryview(buffer)[:bucketCount * BUCKET_SIZE * ENTRY_SIZE]
+        self.words = view.cast("Q")  # unsigned 64-bit view for keys and packed data
+        self.scores = view.cast("d")  # float view of the same memory for scores
+        self.generation = 1
+        self.isolated = False  # set by Isolate, only entries of the current generation are seen
+        self.hits = 0
+        self.probes = 0
+
+    # wipe every entry, for a new game
+    def Clear(self):
+        memoryview(self.buffer)[:] = bytes(len(self.buffer))
+        self.generation = 1
+
+    # call once per search so old entries lose their depth priority
+    def NewSearch(self):
+        self.generation = self.generation % 255 + 1
+
+    # from now on the table acts as if it were empty at the start of each generation: Probe skips entries
+    # from older ones and Store replaces them, so only the 8-bit generation's wrap-around has to wipe the buffer
+    def Isolate(self):
+        self.isolated = True
+        if self.generation == 255:
+            self.Clear()
+        else:
+            self.generation += 1
+
+    # returns (depth, score, bound, moveID) for the position, or None if it isn't stored
+    def Probe(self, key):
+        self.probes += 1
+        words = self.words
+        index = (key & self.mask) * BUCKET_SIZE * ENTRY_WORDS
+        for i in range(index, index + BUCKET_SIZE * ENTRY_WORDS, ENTRY_WORDS):
+            data = words[i + 1]
+            if data and words[i] ^ data ^ words[i + 2] == key and \
+                    (not self.isolated or data >> 26 == self.generation):
+                self.hits += 1
+                return (data & 0xFF) - 1, self.scores[i + 2], (data >> 8) & 0x3, (data >> 10) & 0xFFFF
+        return None
+
+    def Store(self, key, depth, score, bound, moveID):
+        words = self.words
+        index = (key & self.mask) * BUCKET_SIZE * ENTRY_WORDS
+        data = words[index + 1]
+        storedDepth = (data & 0xFF) - 1
+        storedGeneration = data >> 26
+        samePosition = words[index] ^ data ^ words[index + 2] == key and \
+            (not self.isolated or storedGeneration == self.generation)
+        # depth-preferred slot: take it if it is empty, the same position, from an older search or shallower
+        if data == 0 or samePosition or storedGeneration != self.generation or depth >= storedDepth:
+            if samePosition and moveID == 0:
+                moveID = (data >> 10) & 0xFFFF  # keep the old best move rather than forgetting it
+        else:
+            index += ENTRY_WORDS  # always-replace slot
+        data = (depth + 1) | bound << 8 | moveID << 10 | self.generation << 26
+        self.scores[index + 2] = score
+        words[index + 1] = data
+        words[index] = key ^ data ^ words[index + 2]
+
+    # fraction of probes that found their position
+    def HitRate(self):
+        return self.hits / self.probes if self.probes else 0
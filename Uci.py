@@ -0,0 +1,187 @@
+"""
+UCI front end - lets chess GUIs, tournament managers and test tools drive the engine over stdin and stdout
+Supports uci, isready, ucinewgame, position, go, stop, setoption (Hash, Threads, Skill Level, OwnBook) and quit
+The search runs in a thread so stop and isready are answered while it thinks
+The search reports its progress through the info callback, so stdout only carries UCI
+"""
+
+import os
+import sys
+import threading
+import time
+from multiprocessing import Value
+
+import BitboardEngine
+import ChessEngine
+import SmartMoveFinder
+
+ENGINE_NAME = "Chess-Python"
+DEFAULT_MOVES_TO_GO = 30  # how many moves the remaining clock time is shared between when the GUI doesn't say
+
+
+class UciEngine:
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.outputLock = threading.Lock()  # the search thread and the command loop both write
+        self.gs = BitboardEngine.BitboardGameState()
+        self.skillLevel = 5
+        self.threads = 1
+        self.bookFile = SmartMoveFinder.BOOK_FILE  # OwnBook switches between this and no book
+        self.stopSignal = Value("i", 0)
+        self.searchID = 0
+        self.searchThread = None
+        self.stopped = threading.Event()  # set by stop, an infinite search waits for it before answering
+        self.searchStart = 0
+
+    def Send(self, line):
+        with self.outputLock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    # handles one command line, returns False on quit
+    def Command(self, line):
+        words = line.split()
+        if not words:
+            return True
+        command, args = words[0], words[1:]
+        if command == "uci":
+            self.Send(f"id name {ENGINE_NAME}")
+            self.Send("id author Chess-Python contributors")
+            self.Send(f"option name Hash type spin default {SmartMoveFinder.TT_SIZE_MB} min 1 max 4096")
+            self.Send("option name Threads type spin default 1 min 1 max 256")
+            self.Send("option name Skill Level type spin default 5 min 1 max 5")
+            self.Send("option name OwnBook type check default true")
+            self.Send("uciok")
+        elif command == "isready":
+            self.Send("readyok")
+        elif command == "ucinewgame":
+            self.Stop()
+            SmartMoveFinder.GetTranspositionTable().Clear()
+            SmartMoveFinder.ClearOrderingTables()
+        elif command == "position":
+            self.Stop()
+            self.SetPosition(args)
+        elif command == "go":
+            self.Stop()
+            self.Go(args)
+        elif command == "stop":
+            self.Stop()
+        elif command == "setoption":
+            self.SetOption(args)
+        elif command == "quit":
+            self.Stop()
+            SmartMoveFinder.ShutdownSearchPool()
+            return False
+        return True
+
+    # position startpos|fen <fen> [moves <move> ...]
+    def SetPosition(self, args):
+        moves = args.index("moves") if "moves" in args else len(args)
+        if args and args[0] == "fen":
+            fen = " ".join(args[1:moves])
+        else:
+            fen = ChessEngine.START_FEN
+        self.gs = BitboardEngine.BitboardGameState()
+        self.gs.FenString(fen)
+        for text in args[moves + 1:]:
+            try:
+                move = self.gs.GetMoveFromCoordinates(text)
+            except ValueError as error:  # playing on from a different position would be worse than stopping here
+                self.Send(f"info string {error}, the position stops before it")
+                break
+            self.gs.MakeMove(move)
+
+    # setoption name <name> value <value>
+    def SetOption(self, args):
+        if "name" not in args or "value" not in args:
+            return
+        name = " ".join(args[args.index("name") + 1:args.index("value")]).lower()
+        value = " ".join(args[args.index("value") + 1:])
+        if name == "hash":
+            SmartMoveFinder.SetHashSize(int(value))
+            SmartMoveFinder.ShutdownSearchPool()  # the parallel search's shared table is sized when it starts
+        elif name == "threads":
+            self.threads = max(1, int(value))
+        elif name == "skill level":
+            self.skillLevel = min(5, max(1, int(value)))
+        elif name == "ownbook":
+            SmartMoveFinder.SetOpeningBook(self.bookFile if value.lower() == "true" else None)
+
+    # go [depth N] [movetime ms] [wtime ms] [btime ms] [winc ms] [binc ms] [movestogo N] [nodes N] [infinite]
+    def Go(self, args):
+        options = {}
+        for i, word in enumerate(args):
+            if word in ("depth", "movetime", "wtime", "btime", "winc", "binc", "movestogo", "nodes") and \
+                    i + 1 < len(args):
+                options[word] = int(args[i + 1])
+        infinite = "infinite" in args
+        timeLimit = None
+        if "movetime" in options:
+            timeLimit = options["movetime"] / 1000
+        elif ("wtime" if self.gs.whiteToMove else "btime") in options:
+            clock = options["wtime" if self.gs.whiteToMove else "btime"]
+            increment = options.get("winc" if self.gs.whiteToMove else "binc", 0)
+            timeLimit = (clock / options.get("movestogo", DEFAULT_MOVES_TO_GO) + increment * 0.8) / 1000
+            timeLimit = min(timeLimit, clock / 1000 * 0.5)  # never risk more than half the clock on one move
+        maxDepth = options.get("depth")
+        if maxDepth is None and (infinite or timeLimit is not None or "nodes" in options):
+            maxDepth = SmartMoveFinder.MAX_DEPTH
+
+        self.searchID += 1
+        self.stopped.clear()
+        self.searchStart = time.perf_counter()
+        self.searchThread = threading.Thread(target=self.Search,
+                                             args=(timeLimit, options.get("nodes"), maxDepth, infinite))
+        self.searchThread.start()
+
+    def Search(self, timeLimit, nodeLimit, maxDepth, infinite):
+        gs = self.gs
+        validMoves = gs.GetValidMoves()
+        SmartMoveFinder.SetSearchControl(self.stopSignal, self.searchID, self.SendInfo)
+        SmartMoveFinder.counter = 0
+        move = SmartMoveFinder.KnownMove(self.skillLevel, gs, validMoves)
+        if move is not None:
+            self.Send("info string book or tablebase move")
+        elif self.skillLevel < 5:
+            move = SmartMoveFinder.SearchMove(self.skillLevel, validMoves, gs)
+        elif self.threads > 1 and nodeLimit is None:
+            move = SmartMoveFinder.FindBestMoveParallel(gs, validMoves, timeLimit, maxDepth, self.threads)
+        else:
+            move = SmartMoveFinder.FindBestMoveIterativeDeepening(gs, validMoves, timeLimit, nodeLimit, maxDepth)
+        SmartMoveFinder.SetSearchControl()
+        if infinite:  # the GUI decides when an infinite search is over
+            self.stopped.wait()
+        self.Send(f"bestmove {move.GetCoordinates() if move is not None else '0000'}")
+
+    # info line for a finished depth
+    def SendInfo(self, depth, move, score, nodes, line):
+        elapsed = time.perf_counter() - self.searchStart
+        mateIn = SmartMoveFinder.MateIn(score)
+        scoreText = f"mate {mateIn}" if mateIn is not None else f"cp {round(score * 100)}"
+        nps = ChessEngine.NodesPerSecond(nodes, elapsed)
+        self.Send(f"info depth {depth} score {scoreText} nodes {nodes} nps {nps} "
+                  f"time {round(elapsed * 1000)} pv {' '.join(lineMove.GetCoordinates() for lineMove in line)}")
+
+    # stops a running search and waits for its bestmove
+    def Stop(self):
+        if self.searchThread is not None:
+            self.stopSignal.value = self.searchID
+            self.stopped.set()
+            self.searchThread.join()
+            self.searchThread = None
+
+
+def Main():
+    engine = UciEngine(sys.stdout)
+    commands = sys.stdin
+    # forked search processes close sys.stdin as they start, which blocks while this thread is reading it
+    sys.stdin = open(os.devnull)
+    for line in commands:
+        if not engine.Command(line):
+            break
+    else:
+        engine.Stop()
+
+
+if __name__ == "__main__":
+    Main()